@@ -1,21 +1,65 @@
 import os
+import re
 import time
 import openai
+import functools
 from typing import List
-from pydantic import BaseModel
+from pydantic import Field, create_model
 from RoBAssessment import Assessment as assess
+from RoBAssessment import Dedup
+from RoBAssessment import Progress
+from RoBAssessment import Pipeline
 from tenacity import retry, wait_exponential, retry_if_exception_type
 
 # Pydantic Class for Structured Output.
-class AssessmentResult(BaseModel):
+def criteria_field_name(sub_crit_id):
     """
-    Output format for the risk-of-bias assessment.
-    Each field requires explanation to guide the LLM in output generation.
+    Field name of a sub criteria in the output schema, e.g. "1.1" -> "criteria_1_1".
     """
-    explanation: str
-    """"""
-    summary: str
-    """"""
+    return "criteria_" + re.sub(r"\W", "_", str(sub_crit_id))
+
+def build_assessment_result_model():
+    """
+    Builds the output format from the criteria in the prompt file: one explanation field
+    and one decision field per sub criteria, so each decision maps to exactly one CSV column.
+    Output: AssessmentResult pydantic class.
+    """
+    fields = {}
+    for criteria_id, sub_crit_dict in assess.nested_subs.items():
+        for sub_crit_id, sub_crit in sub_crit_dict.items():
+            name = criteria_field_name(sub_crit_id)
+            title = f"{sub_crit_id}) {sub_crit['title']}"
+            fields[f"{name}_explanation"] = (str, Field(..., description=f"A detailed reasoning for {title}, based on evidence from the document."))
+            fields[name] = (assess.Decision, Field(..., description=f"The decision for {title}. Respond only with one of ['yes', 'no']."))
+    return create_model(
+        "AssessmentResult",
+        __doc__="Output format for the risk-of-bias assessment. One explanation and decision per sub criteria.",
+        **fields,
+    )
+
+AssessmentResult = build_assessment_result_model()
+
+def format_notes(parsed):
+    """
+    Notes entry of one paper, each sub criteria with its decision and reasoning.
+    """
+    note = ""
+    for criteria_id, sub_crit_dict in assess.nested_subs.items():
+        for sub_crit_id, sub_crit in sub_crit_dict.items():
+            name = criteria_field_name(sub_crit_id)
+            note += (f"\n{sub_crit_id}) {sub_crit['title']} = {getattr(parsed, name)}\n"
+                     f"\n{getattr(parsed, name + '_explanation')}\n")
+    return note
+
+def summary_row(parsed):
+    """
+    Decisions of one paper, in the order of the summary header.
+    """
+    return [
+        getattr(parsed, criteria_field_name(sub_crit_id))
+        for sub_crit_dict in assess.nested_subs.values()
+        for sub_crit_id in sub_crit_dict.keys()
+    ]
 
 ### Methods ###
 def process_plain_text():
@@ -24,117 +68,125 @@ def process_plain_text():
     Input: NA.
     Output: NA.
     """
-    # Initialize output containers
-    assessment_notes: List[str] = []
-    assessment_notes.append(assess.notes_header)
-    assessment_notes.append("Assessing plain files locally. Assessing all criteria all at once per one paper.")
-    assessment_summary: List[List[str]] = [assess.summary_header]
-    assess.print_and_log("Assessing plain files locally. Assessing all criteria all at once per one paper.")
-
-    # tokens
-    tokens_all_papers = 0
-
     # Get only .txt and .md files
     plain_text_files = [
         f for f in sorted(os.listdir(assess.plain_text_input_folder))
         if f.lower().endswith((".txt", ".md"))
     ]
-    pdfs_count = len(plain_text_files)
-    for i, file_name in enumerate(plain_text_files):
-        assess.print_and_log(f"Processing plain text: File {i + 1}/{pdfs_count}. Filename: {file_name}")
+    # Assess one representative per cluster of duplicates.
+    clusters = Dedup.cluster_plain_text_files(plain_text_files)
+    run_assessment("Assessing plain files locally. Assessing all criteria all at once per one paper.",
+                   "AllCriteria plain text", clusters, Pipeline.load_plain_text)
 
-        note_entry = ""
+def process_pdf_stored_in_cloud(file_dict):
+    """
+    Process all the pdf stored in the cloud. Loop through the dictionary. Saves assessment output files.
+    Input: {file_name: file_id} dictionary.
+    Output: NA.
+    """
+    # Assess one representative per cluster of duplicates.
+    clusters = Dedup.cluster_pdf_files(file_dict)
+    run_assessment("Assessing PDFs stored in cloud. Assessing all criteria all at once per one paper.",
+                   "AllCriteria pdf", clusters, Pipeline.load_stored_pdf(file_dict))
 
-        # Open markdown file.
-        with open(os.path.join(assess.plain_text_input_folder, file_name), "r", encoding="utf-8") as f:
-            document = f.read()
+def process_pdf_local():
+    """
+    Uploads the local pdfs and assesses them as soon as each upload is done. Saves assessment output files.
+    Input: NA.
+    Output: NA.
+    """
+    pdf_files = assess.list_pdf_files()
+    # Duplicates are neither uploaded nor assessed.
+    clusters = Dedup.cluster_pdf_files(dict.fromkeys(pdf_files, ""))
+    run_assessment("Uploading and assessing local PDFs. Assessing all criteria all at once per one paper.",
+                   "AllCriteria pdf", clusters, Pipeline.load_local_pdf)
 
-        note_entry += f"\n=== Paper {i + 1}: {file_name} ===\n"
-        try:
-            if assess.robust_mode == True:
-                structured_response = call_openai_response_api_plain_text_input_robust(assess.prompt_body, document, AssessmentResult)
-            else:
-                structured_response = call_openai_response_api_plain_text_input(assess.prompt_body, document,
-                                                                                       AssessmentResult)
-        except Exception as e:
-            exception = f"Error: {e}. Error prccessing {file_name}"
-            note_entry += f"\n{exception}\n"
-            assess.print_and_log(f"Processing Error. Exception: {exception}")
-            continue
+def run_assessment(description, label, clusters, load):
+    """
+    Runs the assessment pipeline over the cluster representatives and saves the output files.
+    Input: description (string), progress label (string), clusters dictionary, Pipeline loader.
+    Output: NA.
+    """
+    # Initialize output containers
+    assessment_notes: List[str] = []
+    assessment_notes.append(assess.notes_header)
+    assessment_notes.append(description)
+    assessment_summary: List[List[str]] = [assess.summary_header]
+    assess.print_and_log(description)
+
+    # tokens
+    tokens_all_papers = 0
 
-        note_entry += (f"\nFile: {file_name}\n"
-                       f"\n{structured_response.output_parsed.explanation}")
+    file_names = sorted(clusters.keys())  # sorted in ascending order.
+    pdfs_count = len(file_names)
+    Progress.start_run(label, pdfs_count * Progress.requests_per_item())
+    try:
+        results = Pipeline.run(file_names, load, functools.partial(assess_paper, pdfs_count=pdfs_count))
+    finally:
+        Progress.end_run()
 
-        # token
-        tokens_this_paper = structured_response.usage.total_tokens
+    for i, (file_name, result) in enumerate(zip(file_names, results)):
+        if isinstance(result, Exception):
+            assessment_notes.append(f"\n=== Paper {i + 1}: {file_name} ===\n\nError: {result}. Error prccessing {file_name}\n")
+            continue
+        note_entry, full_row, tokens_this_paper = result
         tokens_all_papers += tokens_this_paper
-        assess.print_and_log(f"This paper ({file_name}) consumed {tokens_this_paper} tokens.")
-
         assessment_notes.append(note_entry)
-        summary_row = structured_response.output_parsed.summary.split(",")  # this is output from llm.
-        full_row = [str(i + 1), file_name] + summary_row
-        assessment_summary.append(full_row)
-        time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
+        if full_row is not None:
+            assessment_summary.append(full_row)
 
     assess.print_and_log("Processed " + str(pdfs_count) + " papers.")
     assess.print_and_log("Consumed "+str(tokens_all_papers) +" for "+str(pdfs_count)+" papers.")
+    assessment_summary = Dedup.fan_out_duplicates(assessment_summary, assessment_notes, clusters)
     # Save outputs
     assess.save_outputs(assessment_notes, assessment_summary)
 
-def process_pdf_stored_in_cloud(file_dict):
+def assess_paper(i, file_name, pdfs_count, document=None, file_id=None, **loaded):
     """
-    Process all the pdf stored in the cloud. Loop through the dictionary. Saves assessment output files.
-    Input: {file_name: file_id} dictionary.
-    Output: NA.
+    Assess all criteria of one paper, given either as plain text (document) or stored in the cloud (file_id).
+    Input: paper index, file name, number of papers, document (string) or file_id (string).
+    Output: (note_entry, summary row or None on error, tokens consumed).
     """
-    # Initialize output containers
-    assessment_notes: List[str] = []
-    assessment_notes.append(assess.notes_header)
-    assessment_notes.append("Assessing PDFs stored in cloud. Assessing all criteria all at once per one paper.")
-    assessment_summary: List[List[str]] = [assess.summary_header]
-    assess.print_and_log("Assessing PDFs stored in cloud. Assessing all criteria all at once per one paper.")
-
-    # tokens.
-    tokens_all_papers = 0
-
-    pdfs_count = len(file_dict.keys())
-    for i, file_name in enumerate(sorted(file_dict.keys())):  # sorted in ascending order.
+    assess.set_log_context(paper=file_name)
+    if document is not None:
+        assess.print_and_log(f"Processing plain text: File {i + 1}/{pdfs_count}. Filename: {file_name}")
+    else:
         assess.print_and_log(f"Processing pdf file: File {i + 1}/{pdfs_count}. Filename: {file_name}")
-        file_id = file_dict[file_name]
-
-        note_entry = ""
-        note_entry += f"\n=== Paper {i + 1}: {file_name} ===\n"
 
-        try:
+    note_entry = ""
+    note_entry += f"\n=== Paper {i + 1}: {file_name} ===\n"
+    started = Progress.request_started()
+    try:
+        if document is not None:
             if assess.robust_mode == True:
-                structured_response = call_openai_response_api_file_upload_robust(assess.prompt_body, file_id, AssessmentResult)
+                structured_response, response = call_openai_response_api_plain_text_input_robust(assess.prompt_body, document, AssessmentResult)
+            else:
+                structured_response = call_openai_response_api_plain_text_input(assess.prompt_body, document,
+                                                                                 AssessmentResult)
+        else:
+            if assess.robust_mode == True:
+                structured_response, response = call_openai_response_api_file_upload_robust(assess.prompt_body, file_id, AssessmentResult)
             else:
                 structured_response = call_openai_response_api_file_upload(assess.prompt_body, file_id,
-                                                                                  AssessmentResult)
-        except Exception as e:
-            exception = f"Error: {e}. Error prccessing {file_name}"
-            note_entry += f"\n{exception}\n"
-            assess.print_and_log(f"Processing Error. Exception: {exception}")
-            continue
+                                                                            AssessmentResult)
+    except Exception as e:
+        Progress.request_failed(started, Progress.requests_per_item())
+        exception = f"Error: {e}. Error prccessing {file_name}"
+        note_entry += f"\n{exception}\n"
+        assess.print_and_log(f"Processing Error. Exception: {exception}")
+        return note_entry, None, 0
 
-        note_entry += (f"\nTitle: {file_name}\n"
-                       f"\n{structured_response.output_parsed.explanation}")
-
-        # token
-        tokens_this_paper = structured_response.usage.total_tokens
-        tokens_all_papers += tokens_this_paper
-        assess.print_and_log(f"This paper ({file_name}) consumed {tokens_this_paper} tokens.")
+    note_entry += (f"\n{'File' if document is not None else 'Title'}: {file_name}\n"
+                   f"{format_notes(structured_response.output_parsed)}")
 
-        assessment_notes.append(note_entry)
-        summary_row = structured_response.output_parsed.summary.split(",")  # this is output from llm.
-        full_row = [str(i + 1), file_name] + summary_row
-        assessment_summary.append(full_row)
-        time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
+    # token
+    tokens_this_paper = structured_response.usage.total_tokens
+    Progress.request_finished(started, tokens_this_paper, Progress.requests_per_item())
+    assess.print_and_log(f"This paper ({file_name}) consumed {tokens_this_paper} tokens.")
 
-    assess.print_and_log("Processed " + str(pdfs_count) + " papers.")
-    assess.print_and_log("Consumed " +str(tokens_all_papers) + " for " + str(pdfs_count) + " papers.")
-    # Save outputs
-    assess.save_outputs(assessment_notes, assessment_summary)
+    full_row = [str(i + 1), file_name] + summary_row(structured_response.output_parsed)
+    time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
+    return note_entry, full_row, tokens_this_paper
 
 ### API Calls ###
 @retry(wait=wait_exponential(multiplier=assess.retry_multiplier, min=assess.retry_min, max=assess.retry_max),
@@ -146,7 +198,7 @@ def call_openai_response_api_file_upload(messages, file_id, output_format):
     :param messages: messages (prompt, string), file_id (string).
     :return: AssessmentResult
     """
-    response = assess.client.responses.parse(
+    response = assess.parse_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_message,
@@ -179,7 +231,7 @@ def call_openai_response_api_file_upload_robust(messages, file_id, output_format
     :param messages: messages (prompt, string), file_id (string).
     :return: AssessmentResult
     """
-    response = assess.client.responses.parse(
+    response = assess.parse_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_message,
@@ -213,7 +265,7 @@ def call_openai_response_api_plain_text_input(messages, document, output_format)
     :param messages: messages (prompt, string), document (string).
     :return: AssessmentResult
     """
-    response = assess.client.responses.parse(
+    response = assess.parse_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_message,
@@ -246,7 +298,7 @@ def call_openai_response_api_plain_text_input_robust(messages, document, output_
     :param messages: messages (prompt, string), document (string).
     :return: AssessmentResult
     """
-    response = assess.client.responses.create(
+    response = assess.create_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_message,
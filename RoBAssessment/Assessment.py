@@ -1,10 +1,23 @@
 import os
+import re
+import sys
 import csv
+import json
 import time
 import yaml
+import types
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
 import tiktoken
-from openai import OpenAI
+from typing import Literal
+from openai import OpenAI, AsyncOpenAI
+from RoBAssessment import Transport
+from RoBAssessment import Dispatcher
+from RoBAssessment import Hedging
+from RoBAssessment import Scheduler
 """
 Script to extract structured data from a set of markdown-converted papers
 using the OpenAI API, based on a protocol spreadsheet, and output a CSV.
@@ -16,7 +29,6 @@ with open("config.yaml", "r") as config_file:
 
 # Set OpenAI API key and model
 apikey = config["api_key"]
-client = OpenAI(api_key=apikey)
 model_name = config.get("model", "gpt-4o")  # default gpt-4o
 parser_model_name = config.get("parser_model", "gpt-4o-mini")
 mode = config.get("mode", "one_by_one")  # default to one_by_one
@@ -28,6 +40,14 @@ robust_mode = config["RobustMode"]
 # Set tiktoken encoder.
 enc = tiktoken.encoding_for_model(model_name)
 
+# Conversation Mode (PerCriteria): document sent once per paper, sub criteria chained with previous_response_id.
+conversation_mode = config.get("ConversationMode", False)
+keep_conversations = config.get("KeepConversations", False)  # stored paper responses are deleted after the paper.
+
+# Streaming Mode (PerCriteria): decision first, explanation optionally capped.
+streaming_mode = config.get("StreamingMode", False)
+explanation_token_limit = config.get("ExplanationTokenLimit", 0)  # 0 = full explanation.
+
 # Between assessment sleep time in seconds
 sleep_time = config.get("SleepTime", 0.5)
 
@@ -43,6 +63,96 @@ output_folder = config["output_files_folder"]
 prompt_file = config["prompt_file_path"]
 logger_output_folder = config["logger_output_folder"]
 
+# Pipeline
+assessment_workers = config.get("AssessmentWorkers", 1)  # papers assessed concurrently.
+prefetch_depth = config.get("PrefetchDepth", 2)  # papers loaded / uploaded ahead of the assessment.
+
+# HTTP transport
+# Pool sized to the concurrency: assessment workers + the uploading loader + headroom.
+http_max_connections = config.get("HTTPMaxConnections") or assessment_workers + 3
+http_keepalive_expiry = config.get("HTTPKeepAliveExpiry", 30)  # seconds
+http2 = config.get("HTTP2", True)  # used when the h2 package is installed.
+default_timeouts = {
+    "default": {"connect": 10, "read": 120, "write": 30, "pool": 30, "total": 300},
+    "parser": {"connect": 10, "read": 60, "write": 30, "pool": 30, "total": 120},
+    "upload": {"connect": 10, "read": 120, "write": 600, "pool": 30, "total": 900},
+}
+timeouts = {name: {**profile, **config.get("Timeouts", {}).get(name, {})} for name, profile in default_timeouts.items()}
+
+# Endpoint pool, defaults to the single api_key above.
+endpoint_configs = config.get("Endpoints") or [{"name": "default", "api_key": apikey}]
+
+def build_endpoint(index, entry):
+    client_kwargs = {"api_key": entry.get("api_key") or apikey}
+    if entry.get("base_url"):
+        client_kwargs["base_url"] = entry["base_url"]
+    return Dispatcher.Endpoint(
+        name=entry.get("name") or f"endpoint-{index + 1}",
+        client=OpenAI(**client_kwargs, http_client=Transport.build_http_client(
+            http_max_connections, http_keepalive_expiry, http2, timeouts["default"])),
+        async_client=AsyncOpenAI(**client_kwargs, http_client=Transport.build_async_http_client(
+            http_max_connections, http_keepalive_expiry, http2, timeouts["default"])),
+        tpm=entry.get("tpm", 0),
+        rpm=entry.get("rpm", 0),
+        files=entry.get("files", True),
+        model_map=entry.get("model_map"),
+    )
+
+# Fair-share scheduler shared by all assessment processes of the account.
+scheduler = Scheduler.Scheduler(
+    enabled=config.get("Scheduler", False),
+    folder=config.get("scheduler_folder", "cache/scheduler"),
+    tpm=config.get("SchedulerTokensPerMinute") or config.get("TokensPerMinuteBudget", 0),
+    rpm=config.get("SchedulerRequestsPerMinute", 0),
+    weight=config.get("SchedulerWeight", 1),
+    interactive_requests=config.get("SchedulerInteractiveRequests", 50),
+    output_estimate=config.get("SchedulerOutputTokenEstimate", 1000),
+    pace_window=config.get("SchedulerPaceWindow", 0),
+)
+dispatcher = Dispatcher.Dispatcher(
+    [build_endpoint(i, entry) for i, entry in enumerate(endpoint_configs)],
+    backoff_min=config.get("EndpointBackoffMinimum", 1),
+    backoff_max=config.get("EndpointBackoffMaximum", 60),
+    scheduler=scheduler if scheduler.enabled else None,
+    call_threads=http_max_connections * 2,  # leaves room for calls abandoned after their deadline.
+)
+# Hedged requests (not used for streamed calls, the decision callback would fire twice).
+hedger = Hedging.Hedger(
+    enabled=config.get("Hedging", False),
+    percentile=config.get("HedgePercentile", 95),
+    budget=config.get("HedgeBudget", 0.1),
+    min_samples=config.get("HedgeMinSamples", 20),
+)
+# Client of the first endpoint.
+client = dispatcher.endpoints[0].client
+
+# Deduplication of input papers
+deduplication = config.get("Deduplication", True)
+dedup_threshold = config.get("DedupThreshold", 0.9)  # estimated Jaccard similarity
+dedup_shingle_size = config.get("DedupShingleSize", 5)  # words per shingle
+dedup_num_perm = config.get("DedupNumPerm", 128)  # MinHash permutations
+dedup_bands = config.get("DedupBands", 32)  # LSH bands, must divide DedupNumPerm
+fingerprint_cache_file = config.get("fingerprint_cache_file", "cache/fingerprints.json")
+
+# Plain text preprocessing
+preprocessing = config.get("Preprocessing", False)
+preprocess_strip_sections = config.get("PreprocessStripSections", [])
+preprocess_repeated_line_min = config.get("PreprocessRepeatedLineMinimum", 4)  # 0 = keep repeated lines.
+preprocess_max_table_rows = config.get("PreprocessMaxTableRows", 30)  # 0 = keep full tables.
+preprocess_cache_folder = config.get("preprocess_cache_folder", "cache/preprocessed")
+
+# Progress display
+progress_display = config.get("ProgressDisplay", True)
+tpm_budget = config.get("TokensPerMinuteBudget", 0)  # 0 = no budget shown.
+progress_refresh_interval = config.get("ProgressRefreshInterval", 0.5)  # seconds, terminal redraw.
+progress_log_interval = config.get("ProgressLogInterval", 30)  # seconds, log lines when not a terminal.
+progress_latency_window = config.get("ProgressLatencyWindow", 50)  # requests in the rolling latency.
+
+# Benchmark
+benchmark_configurations = config.get("BenchmarkConfigurations", [])
+benchmark_reference_file = config.get("benchmark_reference_file", "reference/assessment_reference.csv")
+benchmark_recordings_folder = config.get("benchmark_recordings_folder", "cache/benchmark")
+
 # Load YAML prompt script
 with open(prompt_file, "r") as f:
     script = yaml.safe_load(f)
@@ -81,6 +191,9 @@ nested_subs = {
     for crit in script.get("Criteria", [])
 }
 
+# Decision of a sub criteria, the same in the output formats of both modes.
+Decision = Literal["yes", "no"]
+
 # for AllCriteria (all criteria joined):
 prompt_body = "\n\n".join(
     sub["explanation"].rstrip()
@@ -97,29 +210,342 @@ for criteria_id, sub_crit_dict in nested_subs.items():
         column_header = f", {sub_crit_id}) {sub_crit['title']}"
         CSVEntryHeader = "".join([CSVEntryHeader, column_header])
 summary_header = CSVEntryHeader.split(", ")
+sub_criteria_count = sum(len(sub_crit_dict) for sub_crit_dict in nested_subs.values())
 
 ### Logger ###
 t = time.localtime()
 start_system_time = time.strftime("%d-%m-%Y_%H:%M:%S", t)
 
-# File handler for logger.
+# Logging settings
+log_format = config.get("LogFormat", "json")  # "json" or "text" for the log file.
+log_max_bytes = config.get("LogMaxBytes", 10 * 1024 * 1024)  # rotate rob_log_*.log above this size.
+log_backup_count = config.get("LogBackupCount", 5)
+console_verbosity = config.get("ConsoleVerbosity", "normal")  # "quiet", "normal" or "verbose".
+console_levels = {"quiet": logging.WARNING, "normal": logging.INFO, "verbose": logging.DEBUG}
+
+# Per-thread log context (paper, criterion), the run is the start time of this session.
+_log_context = threading.local()
+
+def set_log_context(**context):
+    """
+    Sets fields attached to every log record of the calling thread, e.g. paper=..., criterion=...
+    A value of None removes the field.
+    """
+    current = getattr(_log_context, "fields", {})
+    current = {**current, **context}
+    _log_context.fields = {k: v for k, v in current.items() if v is not None}
+
+def clear_log_context():
+    _log_context.fields = {}
+
+def get_log_context():
+    return dict(getattr(_log_context, "fields", {}))
+
+def in_log_context(function):
+    """
+    Wraps function so it runs with the log context of the calling thread, e.g. on a worker thread or as a callback.
+    """
+    fields = get_log_context()
+
+    def wrapper(*args, **kwargs):
+        previous = getattr(_log_context, "fields", {})
+        _log_context.fields = fields
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _log_context.fields = previous
+    return wrapper
+
+class ContextFilter(logging.Filter):
+    """
+    Attaches the run id and the calling thread's context to the record, before it is queued.
+    """
+    def filter(self, record):
+        record.run = start_system_time
+        record.context = dict(getattr(_log_context, "fields", {}))
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "run": getattr(record, "run", start_system_time),
+            **getattr(record, "context", {}),
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class ConsoleHandler(logging.StreamHandler):
+    """
+    Prints the bare message to the console, keeping the live progress line below it.
+    """
+    def emit(self, record):
+        from RoBAssessment import Progress  # imported here, Progress depends on this module.
+        with Progress.console_lock:  # the status line is redrawn under the same lock.
+            Progress.clear_line()
+            super().emit(record)
+            Progress.redraw()
+
+# File handler for logger, rotated by size.
 os.makedirs(logger_output_folder, exist_ok=True)
+file_handler = logging.handlers.RotatingFileHandler(
+    os.path.join(logger_output_folder, f"rob_log_{start_system_time}.log"),
+    maxBytes=log_max_bytes, backupCount=log_backup_count, encoding="utf-8")
+file_handler.setLevel(logging.INFO)
+if log_format == "json":
+    file_handler.setFormatter(JsonFormatter())
+else:
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+console_handler = ConsoleHandler(sys.stdout)
+console_handler.setLevel(console_levels.get(console_verbosity, logging.INFO))
+# Library records (e.g. httpx request lines) only reach the console as warnings or in verbose mode.
+console_handler.addFilter(lambda record: record.name == "logger" or record.levelno >= logging.WARNING
+                          or console_verbosity == "verbose")
+console_handler.setFormatter(logging.Formatter("%(message)s"))
+
+# Callers only enqueue records; formatting and I/O happen on the listener's background thread.
+log_queue = queue.Queue(-1)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter("%(message)s"))
+queue_handler.addFilter(ContextFilter())
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # Setup logger.
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler(os.path.join(logger_output_folder, f"rob_log_{start_system_time}.log"), encoding="utf-8")]
-)
+logging.basicConfig(level=min(logging.INFO, console_handler.level), handlers=[queue_handler])
 logger = logging.getLogger("logger")
+# Per-request INFO lines of the HTTP / API libraries are kept out of the console and the log file.
+for library in ("httpx", "httpcore", "openai"):
+    logging.getLogger(library).setLevel(logging.DEBUG if console_verbosity == "verbose" else logging.WARNING)
 
-def print_and_log(*args, sep=" ", end="\n", file=None, flush=False):
+def print_and_log(*args, sep=" ", level=logging.INFO):
+    """
+    Logs the message to the log file and the console (depending on ConsoleVerbosity).
+    Non-blocking, the record is written by the background log listener.
+    """
     message = sep.join(str(a) for a in args)
-    logger.info(message)                  # log to file
-    print(message, sep=sep, end=end, file=file, flush=flush)  # print to console
+    logger.log(level, message)
+
+def flush_logs():
+    """
+    Blocks until all queued log records are written, e.g. before showing a menu.
+    """
+    log_queue.join()
 
 ### Methods ###
 
+# Per-thread count of requests and request payload bytes, for the per-paper report.
+_request_stats = threading.local()
+
+def count_request(kwargs):
+    """
+    Counts a request and adds the size of its payload (instructions + input) to the calling thread's counters.
+    """
+    payload = json.dumps({"instructions": kwargs.get("instructions"), "input": kwargs.get("input")}, ensure_ascii=False)
+    _request_stats.bytes_sent = get_request_bytes() + len(payload.encode("utf-8"))
+    _request_stats.requests = get_request_count() + 1
+
+def get_request_bytes():
+    return getattr(_request_stats, "bytes_sent", 0)
+
+def get_request_count():
+    return getattr(_request_stats, "requests", 0)
+
+def reset_request_stats():
+    _request_stats.bytes_sent = 0
+    _request_stats.requests = 0
+
+def add_request_stats(bytes_sent, requests):
+    """
+    Adds requests counted on another thread (e.g. a worker of this paper) to the calling thread's counters.
+    """
+    _request_stats.bytes_sent = get_request_bytes() + bytes_sent
+    _request_stats.requests = get_request_count() + requests
+
+# Input tokens of contexts the tokenizer can't see (uploaded files, stored responses), learned from completed calls.
+context_tokens = {}
+_context_lock = threading.Lock()
+
+def request_contexts(kwargs):
+    """
+    Uploaded file ids and the previous response id referenced by a request.
+    """
+    contexts = [kwargs["previous_response_id"]] if kwargs.get("previous_response_id") else []
+    for message in kwargs.get("input") or []:
+        if isinstance(message, dict):
+            contexts += [c["file_id"] for c in message.get("content") or [] if isinstance(c, dict) and c.get("file_id")]
+    return contexts
+
+def visible_input_tokens(kwargs):
+    """
+    Tokens of the instructions and the text input of a request.
+    """
+    texts = [kwargs.get("instructions") or ""]
+    for message in kwargs.get("input") or []:
+        if isinstance(message, dict):
+            texts += [c.get("text") or "" for c in message.get("content") or [] if isinstance(c, dict)]
+        else:
+            texts.append(str(message))
+    return len(enc.encode("".join(texts)))
+
+def learn_context_tokens(kwargs, response):
+    """
+    Records the tokens of a stored response (the context of chained calls), and the tokens of an
+    uploaded file the first time a completed call references it.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    if kwargs.get("store") and getattr(response, "id", None):
+        with _context_lock:
+            context_tokens[response.id] = usage.total_tokens  # input (with its own context) + output.
+    unknown = [c for c in request_contexts(kwargs) if c not in context_tokens]
+    input_tokens = getattr(usage, "input_tokens", None)
+    if len(unknown) == 1 and input_tokens is not None:
+        known = sum(context_tokens.get(c, 0) for c in request_contexts(kwargs) if c not in unknown)
+        with _context_lock:
+            context_tokens[unknown[0]] = max(0, input_tokens - known - visible_input_tokens(kwargs))
+
+def _call_responses(method, profile, kwargs):
+    """
+    client.responses.<method> on the least-loaded endpoint, with the connect/read/write/pool
+    timeouts and the total deadline of the profile.
+    """
+    return dispatcher.call(
+        lambda endpoint, **kw: getattr(endpoint.client.responses, method)(timeout=Transport.build_timeout(timeouts[profile]), **kw),
+        kwargs, timeouts[profile]["total"])
+
+def _async_call_responses(method, profile, kwargs):
+    """
+    Async counterpart of _call_responses, on the async clients.
+    """
+    return dispatcher.async_call(
+        lambda endpoint, **kw: getattr(endpoint.async_client.responses, method)(timeout=Transport.build_timeout(timeouts[profile]), **kw),
+        kwargs, timeouts[profile]["total"])
+
+def create_response(profile="default", **kwargs):
+    """
+    client.responses.create on the least-loaded endpoint, with the connect/read/write/pool
+    timeouts and the total deadline of the profile. Hedged on the async clients when Hedging is enabled.
+    """
+    count_request(kwargs)
+    response, endpoint = hedger.call(
+        f"{kwargs.get('model')}/{profile}",
+        lambda: _call_responses("create", profile, kwargs),
+        lambda: _async_call_responses("create", profile, kwargs))
+    learn_context_tokens(kwargs, response)
+    return response
+
+def parse_response(profile="default", **kwargs):
+    """
+    client.responses.parse on the least-loaded endpoint, with the connect/read/write/pool
+    timeouts and the total deadline of the profile. Hedged on the async clients when Hedging is enabled.
+    """
+    count_request(kwargs)
+    response, endpoint = hedger.call(
+        f"{kwargs.get('model')}/{profile}",
+        lambda: _call_responses("parse", profile, kwargs),
+        lambda: _async_call_responses("parse", profile, kwargs))
+    learn_context_tokens(kwargs, response)
+    return response
+
+async def async_create_response(profile="default", **kwargs):
+    """
+    Async counterpart of create_response, for callers running an event loop (not hedged).
+    Cancelling the task closes the request.
+    """
+    count_request(kwargs)
+    response, endpoint = await _async_call_responses("create", profile, kwargs)
+    learn_context_tokens(kwargs, response)
+    return response
+
+async def async_parse_response(profile="default", **kwargs):
+    """
+    Async counterpart of parse_response, for callers running an event loop (not hedged).
+    Cancelling the task closes the request.
+    """
+    count_request(kwargs)
+    response, endpoint = await _async_call_responses("parse", profile, kwargs)
+    learn_context_tokens(kwargs, response)
+    return response
+
+def stream_response(profile="default", decision_field="result", on_decision=None, explanation_token_limit=0, **kwargs):
+    """
+    Streams client.responses.stream on the least-loaded endpoint. The decision field is surfaced through
+    on_decision(decision, seconds) as soon as it is generated; when explanation_token_limit is set, the
+    stream is cancelled after that many explanation tokens and the explanation is returned truncated.
+    Output: the parsed response, or a StreamedResponse when the stream was cancelled.
+    """
+    count_request(kwargs)
+    if on_decision is not None:
+        on_decision = in_log_context(on_decision)  # called on the deadline thread.
+    response, endpoint = dispatcher.call(
+        lambda endpoint, **kw: consume_stream(endpoint, profile, decision_field, on_decision, explanation_token_limit, **kw),
+        kwargs, timeouts[profile]["total"])
+    if not isinstance(response, StreamedResponse):
+        learn_context_tokens(kwargs, response)
+    return response
+
+class StreamedResponse:
+    """
+    Response-like result of a cancelled stream: output_parsed, output_text and an estimated usage (usage.estimated is set).
+    """
+    def __init__(self, output_parsed, output_text, total_tokens):
+        self.output_parsed = output_parsed
+        self.output_text = output_text
+        self.usage = types.SimpleNamespace(total_tokens=total_tokens, estimated=True)
+
+def consume_stream(endpoint, profile, decision_field, on_decision, explanation_token_limit, **kwargs):
+    decision_pattern = re.compile(r'"' + decision_field + r'"\s*:\s*"(\w+)"')
+    started = time.monotonic()
+    text = ""
+    decision = None
+    explanation_tokens = 0
+    with endpoint.client.responses.stream(timeout=Transport.build_timeout(timeouts[profile]), **kwargs) as stream:
+        for event in stream:
+            if event.type != "response.output_text.delta":
+                continue
+            text += event.delta
+            if decision is None:
+                match = decision_pattern.search(text)
+                if match:
+                    decision = match.group(1)
+                    if on_decision is not None:
+                        on_decision(decision, time.monotonic() - started)
+            else:
+                explanation_tokens += 1  # one delta is about one token.
+                if explanation_token_limit and explanation_tokens >= explanation_token_limit:
+                    break  # leaving the context manager closes the stream.
+        else:
+            return stream.get_final_response()
+
+    # Cancelled: rebuild the result from the partial JSON, usage estimated with the tokenizer
+    # plus the learned tokens of the referenced paper context.
+    match = re.search(r'"explanation"\s*:\s*"((?:[^"\\]|\\.)*)', text)
+    explanation = match.group(1) if match else ""
+    try:
+        explanation = json.loads('"' + explanation + '"')
+    except ValueError:
+        pass  # cut inside an escape sequence, keep the raw text.
+    output_parsed = kwargs["text_format"](**{decision_field: decision, "explanation": explanation + " [explanation truncated]"})
+    input_tokens = visible_input_tokens(kwargs)
+    unknown = []
+    for context in request_contexts(kwargs):
+        if context in context_tokens:
+            input_tokens += context_tokens[context]
+        else:
+            unknown.append(context)
+    if unknown:
+        print_and_log(f"Token usage of a cancelled stream excludes the not yet measured context {', '.join(unknown)}.",
+                      level=logging.WARNING)
+    return StreamedResponse(output_parsed, text, input_tokens + len(enc.encode(text)))
+
 def save_outputs(notes, summary, raw_notes=None):
     with open(os.path.join(output_folder, f"assessment_notes_{start_system_time}.txt"), "w", encoding="utf-8") as f:
         f.write("\n".join(notes))
@@ -134,26 +560,79 @@ def save_outputs(notes, summary, raw_notes=None):
         with open(os.path.join(output_folder, f"assessment_notes_raw_unparsed_{start_system_time}.txt"), "w", encoding="utf-8") as f:
             f.write("\n".join(raw_notes))
         print_and_log(f"Successfully saved assessment_notes_raw_unparsed_{start_system_time}.txt.")
+    flush_logs()
+
 
+def delete_stored_response(response_id):
+    """
+    Deletes a stored response (the paper context of a conversation) on the endpoint holding it.
+    Failures are logged, the response then expires with the retention of the platform.
+    """
+    endpoint = dispatcher.pinned_endpoint({"previous_response_id": response_id}) or dispatcher.endpoints[0]
+    try:
+        endpoint.client.responses.delete(response_id)
+    except Exception as e:
+        print_and_log(f"Stored response {response_id} not deleted: {e}", level=logging.WARNING)
+    dispatcher.unpin_response(response_id)
+    with _context_lock:
+        context_tokens.pop(response_id, None)
 
 def get_number_of_stored_files():
-    return len(client.files.list().data)
+    return sum(len(endpoint.client.files.list().data) for endpoint in dispatcher.endpoints if endpoint.files)
 
 def delete_all_stored_files():
-    files = client.files.list()
-    for file in files.data:
-        client.files.delete(file.id)
-        logging.debug("Deleted file: " + file.filename)
-        print_and_log("Deleted file: " + file.filename)
+    for endpoint in dispatcher.endpoints:
+        if not endpoint.files:
+            continue
+        files = endpoint.client.files.list()
+        for file in files.data:
+            endpoint.client.files.delete(file.id)
+            logging.debug("Deleted file: " + file.filename)
+            print_and_log("Deleted file: " + file.filename)
     print_and_log("Stored files deleted successfully.")
+    flush_logs()
 
 def get_file_name_id_dict():
+    """
+    Lists the stored files of all endpoints, pinning each file id to the endpoint that holds it.
+    A file name stored more than once (e.g. on two endpoints) keeps its first file id.
+    Returns a dictionary: {file_name: file_id}
+    """
     file_dict = {}
-    files = client.files.list()
-    for file in files:
-        file_dict[file.filename] = file.id
+    for endpoint in dispatcher.endpoints:
+        if not endpoint.files:
+            continue
+        files = endpoint.client.files.list()
+        for file in files:
+            dispatcher.pin_file(file.id, endpoint)
+            if file.filename in file_dict:
+                print_and_log(f"{file.filename} is stored more than once, using {file_dict[file.filename]}.")
+                continue
+            file_dict[file.filename] = file.id
     return file_dict
 
+def list_pdf_files():
+    """
+    Returns the sorted names of the .pdf files in the pdf input folder.
+    """
+    return [f for f in sorted(os.listdir(pdf_input_folder)) if f.lower().endswith(".pdf")]
+
+def upload_pdf(file_name):
+    """
+    Uploads one .pdf file from the input folder to OpenAI.
+    Returns the file id.
+    """
+    file_path = os.path.join(pdf_input_folder, file_name)
+    print_and_log("Uploading " + file_name)
+    with open(file_path, "rb") as f:
+        data = f.read()  # in memory, so a failed-over upload starts from the beginning.
+    file, endpoint = dispatcher.call(
+        lambda endpoint, **kw: endpoint.client.files.create(timeout=Transport.build_timeout(timeouts["upload"]), **kw),
+        {"file": (file_name, data), "purpose": "assistants"}, timeouts["upload"]["total"], files=True)
+    dispatcher.pin_file(file.id, endpoint)  # the file only exists on this endpoint.
+    print_and_log("Uploaded " + file_name + " to " + endpoint.name)
+    return file.id
+
 def upload_all_pdfs():
     """
     Uploads all .pdf files in the input folder to OpenAI.
@@ -167,24 +646,19 @@ def upload_all_pdfs():
             logging.warning("This file is not a pdf: " + file_name)
             continue
 
-        file_path = os.path.join(pdf_input_folder, file_name)
         try:
-            print_and_log("Uploading " + file_name)
-            file = client.files.create(
-                file=open(file_path, "rb"),
-                purpose="assistants"
-            )
-            uploaded_files[file_name] = file.id
-            print_and_log("Uploaded " + file_name)
+            uploaded_files[file_name] = upload_pdf(file_name)
             time.sleep(0.1)
 
         except Exception as e:
             print_and_log(f"Failed to upload {file_name}: {e}")
 
+    flush_logs()
     return uploaded_files
 
 def call_parser(response, output_format):
-    parsed = client.responses.parse(
+    parsed = parse_response(
+        "parser",
         model=parser_model_name,
         temperature=0,
         instructions=f"""
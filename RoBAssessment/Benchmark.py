@@ -0,0 +1,266 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import tiktoken
+from typing import Dict, List
+from RoBAssessment import Assessment as assess
+from RoBAssessment import AllCriteria
+from RoBAssessment import PerCriteria
+from RoBAssessment import Pipeline
+from RoBAssessment import Progress
+from RoBAssessment import Preprocess
+"""
+Benchmark of assessment configurations against a labelled reference set.
+Runs each configuration (mode, model, robust / streaming / conversation settings) over the plain text
+papers of the reference CSV and reports per-criterion agreement, Cohen's kappa, tokens, requests and time.
+Per-paper results are recorded, so re-runs reuse them instead of calling the API again.
+"""
+
+# Settings a configuration may override, {config key: Assessment attribute}.
+overridable = {
+    "model": "model_name",
+    "parser_model": "parser_model_name",
+    "robust": "robust_mode",
+    "streaming": "streaming_mode",
+    "conversation": "conversation_mode",
+    "temperature": "model_temperature",
+    "explanation_token_limit": "explanation_token_limit",
+}
+modes = {"all": AllCriteria, "per": PerCriteria}
+
+### Reference ###
+
+def load_reference(file_path):
+    """
+    Reads a reference CSV in the layout of assessment_summary_*.csv.
+    Output: {file_name: {column header: label}} for the criteria columns of the summary header.
+    """
+    with open(file_path, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    header = [h.strip() for h in rows[0]]
+    criteria = assess.summary_header[2:]
+    missing = [c for c in criteria if c not in header]
+    if missing:
+        assess.print_and_log(f"Reference file has no column for: {', '.join(missing)}.")
+    reference = {}
+    for row in rows[1:]:
+        if len(row) < 2:
+            continue
+        values = dict(zip(header, row))
+        reference[row[1].strip()] = {c: normalize_label(values[c]) for c in criteria if c in values}
+    return reference
+
+def normalize_label(label):
+    return str(label).strip().lower()
+
+### Metrics ###
+
+def cohen_kappa(predicted, expected):
+    """
+    Cohen's kappa of two equally long label lists.
+    """
+    n = len(predicted)
+    if n == 0:
+        return None
+    observed = sum(1 for p, e in zip(predicted, expected) if p == e) / n
+    labels = set(predicted) | set(expected)
+    chance = sum((predicted.count(label) / n) * (expected.count(label) / n) for label in labels)
+    if chance == 1:
+        return 1.0 if observed == 1 else 0.0
+    return (observed - chance) / (1 - chance)
+
+def score(results, reference):
+    """
+    Per-criterion agreement and kappa of the predicted rows against the reference.
+    Input: {file_name: summary row}, reference dictionary.
+    Output: {criterion: {"agreement": ..., "kappa": ..., "n": ...}}, including an "overall" entry.
+    """
+    criteria = assess.summary_header[2:]
+    scores = {}
+    pooled_predicted, pooled_expected = [], []
+    for index, criterion in enumerate(criteria):
+        predicted, expected = [], []
+        for file_name, row in results.items():
+            labels = reference.get(file_name, {})
+            if criterion not in labels or row is None:
+                continue
+            decisions = row[2:]
+            predicted.append(normalize_label(decisions[index]) if index < len(decisions) else "missing")
+            expected.append(labels[criterion])
+        pooled_predicted += predicted
+        pooled_expected += expected
+        scores[criterion] = _scores(predicted, expected)
+    scores["overall"] = _scores(pooled_predicted, pooled_expected)
+    return scores
+
+def _scores(predicted, expected):
+    n = len(predicted)
+    return {
+        "agreement": sum(1 for p, e in zip(predicted, expected) if p == e) / n if n else None,
+        "kappa": cohen_kappa(predicted, expected),
+        "n": n,
+    }
+
+### Recordings ###
+
+def configuration_key(configuration):
+    """
+    Key of the recordings: every setting that changes the result of a paper, including the preprocessing
+    of the plain text input (recordings are stored by the raw file hash).
+    """
+    settings = {key: configuration.get(key, getattr(assess, attribute)) for key, attribute in overridable.items()}
+    settings["mode"] = configuration["mode"]
+    settings["prompt"] = hashlib.sha256((assess.intro_message + assess.prompt_body).encode("utf-8")).hexdigest()
+    settings["preprocessing"] = assess.preprocessing
+    if assess.preprocessing:
+        settings["preprocess_options"] = Preprocess.options()
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def recording_path(configuration, sha256):
+    return os.path.join(assess.benchmark_recordings_folder, configuration_key(configuration), sha256 + ".json")
+
+def assess_paper_recorded(configuration, module, i, file_name, pdfs_count, sha256=None, **loaded):
+    """
+    Returns the recorded result of the paper for this configuration, or assesses and records it.
+    Output: {"row": ..., "tokens": ..., "requests": ..., "seconds": ..., "recorded": bool}
+    """
+    path = recording_path(configuration, sha256)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            recorded = json.load(f)
+        recorded["recorded"] = True
+        return recorded
+
+    assess.reset_request_stats()
+    started = time.monotonic()
+    result = module.assess_paper(i, file_name, pdfs_count, sha256=sha256, **loaded)
+    if module is AllCriteria:
+        note_entry, row, tokens = result
+    else:
+        note_entry, raw_note_entry, row, tokens, bytes_sent = result
+    recorded = {
+        "row": row,
+        "tokens": tokens,
+        "requests": assess.get_request_count(),
+        "seconds": time.monotonic() - started,
+    }
+    if row is not None:  # failed papers are not recorded.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(recorded, f)
+    recorded["recorded"] = False
+    return recorded
+
+### Runner ###
+
+def encoder(model):
+    """
+    tiktoken encoder of a model; models unknown to tiktoken (e.g. local ones) keep the current encoder.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        assess.print_and_log(f"No tokenizer known for {model}, counting tokens with the configured model's.")
+        return assess.enc
+
+def run_configuration(configuration, file_names, reference):
+    """
+    Runs one configuration over the papers with the overridden settings.
+    Output: report row (dictionary).
+    """
+    module = modes[configuration["mode"]]
+    saved = {attribute: getattr(assess, attribute) for attribute in overridable.values()}
+    saved["enc"] = assess.enc
+    for key, attribute in overridable.items():
+        if key in configuration:
+            setattr(assess, attribute, configuration[key])
+    if "model" in configuration:
+        assess.enc = encoder(configuration["model"])  # token counts of the overridden model.
+    name = configuration.get("name", configuration_key(configuration))
+    assess.print_and_log(f"Benchmark configuration {name}: {configuration}")
+
+    total_requests = (len(file_names) * Progress.requests_per_item() if module is AllCriteria else
+                      PerCriteria.planned_requests(len(file_names)))
+    started = time.monotonic()
+    try:
+        Progress.start_run(f"Benchmark {name}", total_requests)
+        try:
+            results = Pipeline.run(file_names, Pipeline.load_plain_text,
+                                   lambda i, file_name, **loaded: assess_paper_recorded(
+                                       configuration, module, i, file_name, len(file_names), **loaded))
+        finally:
+            Progress.end_run()
+    finally:
+        for attribute, value in saved.items():
+            setattr(assess, attribute, value)
+    wall_seconds = time.monotonic() - started
+
+    rows = {}
+    for file_name, result in zip(file_names, results):
+        rows[file_name] = None if isinstance(result, Exception) else result["row"]
+    completed = [r for r in results if not isinstance(r, Exception)]
+    scores = score(rows, reference)
+    report = {
+        "configuration": name,
+        "mode": configuration["mode"],
+        "model": configuration.get("model", assess.model_name),
+        "robust": configuration.get("robust", assess.robust_mode),
+        "papers": len(file_names),
+        "failed": len(file_names) - sum(1 for r in completed if r["row"] is not None),
+        "recorded": sum(1 for r in completed if r["recorded"]),
+        "agreement": scores["overall"]["agreement"],
+        "kappa": scores["overall"]["kappa"],
+        "tokens": sum(r["tokens"] for r in completed),
+        "requests": sum(r["requests"] for r in completed),
+        "paper_seconds": sum(r["seconds"] for r in completed),  # assessment time, recorded papers included.
+        "wall_seconds": wall_seconds,  # time of this run, recorded papers take none.
+    }
+    for criterion in assess.summary_header[2:]:
+        report[f"agreement {criterion}"] = scores[criterion]["agreement"]
+        report[f"kappa {criterion}"] = scores[criterion]["kappa"]
+    return report
+
+def run_benchmark():
+    """
+    Runs all configurations of BenchmarkConfigurations over the reference set and saves the report.
+    Input: NA.
+    Output: list of report rows.
+    """
+    reference = load_reference(assess.benchmark_reference_file)
+    file_names = sorted(
+        f for f in reference.keys()
+        if os.path.isfile(os.path.join(assess.plain_text_input_folder, f))
+    )
+    if len(file_names) < len(reference):
+        assess.print_and_log(f"{len(reference) - len(file_names)} reference papers not found in "
+                             f"{assess.plain_text_input_folder}, skipped.")
+    unknown = [c.get("name", c.get("mode")) for c in assess.benchmark_configurations if c.get("mode") not in modes]
+    if unknown:
+        raise ValueError(f"Benchmark configurations {', '.join(map(str, unknown))} need a mode of "
+                         f"{' or '.join(repr(m) for m in modes)}.")
+    assess.print_and_log(f"Benchmarking {len(assess.benchmark_configurations)} configurations on {len(file_names)} papers.")
+
+    reports: List[Dict] = []
+    for configuration in assess.benchmark_configurations:
+        reports.append(run_configuration(configuration, file_names, reference))
+
+    for report in reports:
+        assess.print_and_log(
+            f"{report['configuration']}: agreement {_format(report['agreement'])}, kappa {_format(report['kappa'])}, "
+            f"{report['tokens']} tokens, {report['requests']} requests, {report['paper_seconds']:.0f}s paper time, "
+            f"{report['wall_seconds']:.0f}s wall "
+            f"({report['recorded']}/{report['papers']} papers from recordings, {report['failed']} failed).")
+
+    output_path = os.path.join(assess.output_folder, f"benchmark_{assess.start_system_time}.csv")
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(reports[0].keys()) if reports else ["configuration"])
+        writer.writeheader()
+        writer.writerows(reports)
+    assess.print_and_log(f"Successfully saved benchmark_{assess.start_system_time}.csv.")
+    assess.flush_logs()
+    return reports
+
+def _format(value):
+    return "n/a" if value is None else f"{value:.3f}"
@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import random
+import hashlib
+from typing import Dict, List
+from RoBAssessment import Assessment as assess
+"""
+Corpus-level deduplication of input papers.
+Fingerprints every document (exact hash + MinHash over word shingles), groups
+near-identical documents into clusters and picks one representative per cluster.
+Only representatives are assessed; their results are fanned out to the duplicates.
+"""
+
+# Mersenne prime used for the MinHash permutations.
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed, so signatures stay comparable with the ones stored in the cache.
+_rng = random.Random(1)
+_permutations = [
+    (_rng.randint(1, _PRIME - 1), _rng.randint(0, _PRIME - 1))
+    for _ in range(assess.dedup_num_perm)
+]
+
+### Fingerprints ###
+
+def normalize_text(text):
+    """
+    Lowercase and collapse whitespace, so trivial re-exports hash identically.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def exact_hash(data):
+    """
+    sha256 of bytes or (normalized) text.
+    """
+    if isinstance(data, str):
+        data = normalize_text(data).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def shingles(text, size=None):
+    """
+    Set of hashed word shingles (32 bit) of the normalized text.
+    """
+    size = size or assess.dedup_shingle_size
+    words = normalize_text(text).split(" ")
+    if len(words) < size:
+        words_range = [" ".join(words)]
+    else:
+        words_range = (" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return {
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+        for s in words_range
+    }
+
+def minhash(text):
+    """
+    MinHash signature of the text, one value per permutation.
+    """
+    hashed = shingles(text)
+    return [
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashed)
+        for a, b in _permutations
+    ]
+
+def estimated_jaccard(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+### Cache ###
+
+def load_fingerprint_cache():
+    if not os.path.exists(assess.fingerprint_cache_file):
+        return {}
+    try:
+        with open(assess.fingerprint_cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        assess.print_and_log("Fingerprint cache is unreadable, rebuilding it.")
+        return {}
+    # Signatures built with a different number of permutations are not comparable.
+    if cache.get("num_perm") != assess.dedup_num_perm or cache.get("shingle_size") != assess.dedup_shingle_size:
+        return {}
+    return cache.get("files", {})
+
+def save_fingerprint_cache(files):
+    os.makedirs(os.path.dirname(assess.fingerprint_cache_file) or ".", exist_ok=True)
+    with open(assess.fingerprint_cache_file, "w", encoding="utf-8") as f:
+        json.dump({"num_perm": assess.dedup_num_perm,
+                   "shingle_size": assess.dedup_shingle_size,
+                   "files": files}, f)
+
+def fingerprint_file(file_path, cache, text=True):
+    """
+    Returns {"sha256": ..., "minhash": [...] or None} for a file, using the cache
+    when size and modification time are unchanged.
+    """
+    stat = os.stat(file_path)
+    key = os.path.abspath(file_path)
+    cached = cache.get(key)
+    if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+        return cached
+
+    if text:
+        with open(file_path, "r", encoding="utf-8") as f:
+            document = f.read()
+        fingerprint = {"sha256": exact_hash(document), "minhash": minhash(document)}
+    else:
+        # No text extraction for PDFs, so only byte-identical copies are detected.
+        with open(file_path, "rb") as f:
+            fingerprint = {"sha256": exact_hash(f.read()), "minhash": None}
+
+    fingerprint["size"] = stat.st_size
+    fingerprint["mtime"] = stat.st_mtime
+    cache[key] = fingerprint
+    return fingerprint
+
+### Clustering ###
+
+def cluster_fingerprints(fingerprints):
+    """
+    Groups files into clusters of exact or near duplicates.
+    Input: {file_name: fingerprint} dictionary.
+    Output: {representative_file_name: [duplicate_file_names]}, representatives in sorted order.
+    """
+    names = sorted(fingerprints.keys())
+    parent = {name: name for name in names}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            # Keep the alphabetically first file as representative.
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    # Exact duplicates.
+    by_hash: Dict[str, str] = {}
+    for name in names:
+        digest = fingerprints[name]["sha256"]
+        if digest in by_hash:
+            union(by_hash[digest], name)
+        else:
+            by_hash[digest] = name
+
+    # Near duplicates, LSH banding on the MinHash signatures, then verification.
+    rows = max(1, assess.dedup_num_perm // assess.dedup_bands)
+    buckets: Dict[tuple, List[str]] = {}
+    for name in names:
+        signature = fingerprints[name]["minhash"]
+        if not signature:
+            continue
+        for band in range(assess.dedup_bands):
+            key = (band, tuple(signature[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(name)
+
+    checked = set()
+    for candidates in buckets.values():
+        for a_index, a in enumerate(candidates):
+            for b in candidates[a_index + 1:]:
+                if (a, b) in checked or find(a) == find(b):
+                    continue
+                checked.add((a, b))
+                if estimated_jaccard(fingerprints[a]["minhash"], fingerprints[b]["minhash"]) >= assess.dedup_threshold:
+                    union(a, b)
+
+    clusters: Dict[str, List[str]] = {}
+    for name in names:
+        clusters.setdefault(find(name), [])
+        if find(name) != name:
+            clusters[find(name)].append(name)
+    return clusters
+
+def cluster_plain_text_files(file_names):
+    """
+    Clusters the plain text files found in the plain text input folder.
+    Input: list of file names.
+    Output: {representative_file_name: [duplicate_file_names]}.
+    """
+    if not assess.deduplication:
+        return {name: [] for name in file_names}
+
+    cache = load_fingerprint_cache()
+    fingerprints = {
+        name: fingerprint_file(os.path.join(assess.plain_text_input_folder, name), cache)
+        for name in file_names
+    }
+    save_fingerprint_cache(cache)
+    return _report(cluster_fingerprints(fingerprints))
+
+def cluster_pdf_files(file_dict):
+    """
+    Clusters the uploaded pdf set. Files are fingerprinted from their local copy in the
+    pdf input folder; files without a local copy are kept as their own cluster.
+    Input: {file_name: file_id} dictionary.
+    Output: {representative_file_name: [duplicate_file_names]}.
+    """
+    if not assess.deduplication:
+        return {name: [] for name in file_dict.keys()}
+
+    cache = load_fingerprint_cache()
+    fingerprints = {}
+    for name in file_dict.keys():
+        file_path = os.path.join(assess.pdf_input_folder, name)
+        if os.path.isfile(file_path):
+            fingerprints[name] = fingerprint_file(file_path, cache, text=False)
+        else:
+            fingerprints[name] = {"sha256": "file_id:" + file_dict[name], "minhash": None}
+    save_fingerprint_cache(cache)
+    return _report(cluster_fingerprints(fingerprints))
+
+def _report(clusters):
+    duplicates = sum(len(d) for d in clusters.values())
+    if duplicates:
+        assess.print_and_log(f"Deduplication: {duplicates} duplicate file(s) found, "
+                             f"assessing {len(clusters)} representative(s).")
+        for representative, dupes in clusters.items():
+            for dupe in dupes:
+                assess.print_and_log(f"Duplicate: {dupe} -> {representative}")
+    return clusters
+
+### Fan out ###
+
+def fan_out_duplicates(assessment_summary, assessment_notes, clusters):
+    """
+    Copies each representative's summary row to its duplicates, and adds a
+    "duplicate_of" marker column (always present with Deduplication on, so the CSV layout
+    doesn't depend on the input). Duplicates of a representative without a row (failed)
+    get an error row. Rows are renumbered afterwards.
+    Input: summary (header + rows), notes list, clusters dictionary.
+    Output: new summary list.
+    """
+    if not assess.deduplication:
+        return assessment_summary
+
+    header = assessment_summary[0] + ["duplicate_of"]
+    rows = []
+    assessed = set()
+    for row in assessment_summary[1:]:
+        rows.append(row + [""])
+        file_name = row[1]
+        assessed.add(file_name)
+        for dupe in clusters.get(file_name, []):
+            rows.append([row[0], dupe] + row[2:] + [file_name])
+            assessment_notes.append(f"\n=== Duplicate: {dupe} ===\n\nSame document as {file_name}, see its assessment.\n")
+
+    error_row = ["error"] * (len(header) - 3)
+    for representative, dupes in sorted(clusters.items()):
+        if representative in assessed:
+            continue
+        for dupe in dupes:
+            rows.append(["", dupe] + error_row + [representative])
+            assessment_notes.append(f"\n=== Duplicate: {dupe} ===\n\nSame document as {representative}, "
+                                    f"whose assessment failed.\n")
+
+    for i, row in enumerate(rows):
+        row[0] = str(i + 1)
+    return [header] + rows
@@ -0,0 +1,294 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+import openai
+from RoBAssessment import Transport
+"""
+Load balancing of API calls over a pool of credentials / endpoints.
+Every call goes to the least-loaded endpoint that is within its rate budget. An endpoint that
+returns 429 is backed off exponentially; on connection / server errors the call fails over to
+the next endpoint. Calls referencing an uploaded file id or a stored previous response stay on
+the endpoint holding it.
+"""
+
+logger = logging.getLogger("logger")
+
+# Errors after which the call is retried on another endpoint.
+FAILOVER_ERRORS = (openai.APIConnectionError, openai.InternalServerError, TimeoutError)
+
+def _total_tokens(response):
+    return getattr(getattr(response, "usage", None), "total_tokens", 0) or 0
+
+class Endpoint:
+    """
+    One credential / base URL with its clients, rate budget and rolling usage.
+    """
+    def __init__(self, name, client, async_client, tpm=0, rpm=0, files=True, model_map=None):
+        self.name = name
+        self.client = client
+        self.async_client = async_client
+        self.tpm = tpm  # 0 = no budget.
+        self.rpm = rpm
+        self.files = files  # supports the files API (uploaded pdfs).
+        self.model_map = model_map or {}
+        self.in_flight = 0
+        self.events = deque()  # (timestamp, tokens) of the last minute.
+        self.cooldown_until = 0.0
+        self.rate_limits_in_row = 0
+        self.calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    def _prune(self, now):
+        while self.events and now - self.events[0][0] > 60:
+            self.events.popleft()
+
+    def usage(self, now):
+        """
+        (tokens, requests) of the last minute, in-flight requests counted as requests.
+        """
+        self._prune(now)
+        return sum(t for _, t in self.events), len(self.events) + self.in_flight
+
+    def load(self, now):
+        """
+        Fraction of the rate budget in use; without a budget, the number of in-flight requests.
+        """
+        tokens, requests = self.usage(now)
+        shares = []
+        if self.tpm:
+            shares.append(tokens / self.tpm)
+        if self.rpm:
+            shares.append(requests / self.rpm)
+        return max(shares) if shares else float(self.in_flight)
+
+    def wait_time(self, now):
+        """
+        Seconds until the endpoint may take a request (0 = available now).
+        """
+        wait = max(0.0, self.cooldown_until - now)
+        tokens, requests = self.usage(now)
+        over_budget = (self.tpm and tokens >= self.tpm) or (self.rpm and requests >= self.rpm)
+        if over_budget and self.events:
+            wait = max(wait, 60 - (now - self.events[0][0]))
+        elif over_budget:
+            wait = max(wait, 1.0)  # only in-flight requests, wait for them to finish.
+        return wait
+
+class Dispatcher:
+    def __init__(self, endpoints, backoff_min=1.0, backoff_max=60.0, scheduler=None, call_threads=32):
+        self.endpoints = endpoints
+        self.deadline = Transport.DeadlineExecutor(call_threads)
+        self.scheduler = scheduler  # account-wide fair-share admission, shared with other processes.
+        self.by_name = {endpoint.name: endpoint for endpoint in endpoints}
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.file_endpoints = {}  # {file_id: endpoint name}
+        self.response_endpoints = {}  # {stored response id: endpoint name}
+        self.lock = threading.Lock()
+
+    ### Pinning ###
+
+    def pin_file(self, file_id, endpoint):
+        with self.lock:
+            self.file_endpoints[file_id] = endpoint.name
+
+    def pin_response(self, response_id, endpoint):
+        with self.lock:
+            self.response_endpoints[response_id] = endpoint.name
+
+    def unpin_response(self, response_id):
+        with self.lock:
+            self.response_endpoints.pop(response_id, None)
+
+    def pinned_endpoint(self, kwargs):
+        """
+        Endpoint holding the previous response or an input_file referenced by the request, if any.
+        Pins are keyed by the response / file id, which is unique across endpoints (file names are not).
+        """
+        file_ids = [
+            content["file_id"]
+            for message in kwargs.get("input") or [] if isinstance(message, dict)
+            for content in message.get("content") or [] if isinstance(content, dict) and content.get("file_id")
+        ]
+        with self.lock:
+            name = self.response_endpoints.get(kwargs.get("previous_response_id"))
+            if name is None:
+                name = next((self.file_endpoints[f] for f in file_ids if f in self.file_endpoints), None)
+        return self.by_name[name] if name is not None else None
+
+    ### Routing ###
+
+    def try_acquire(self, candidates, tried):
+        """
+        Marks a request in flight on the least-loaded available candidate.
+        Returns (endpoint, 0), (None, seconds to wait) or (None, None) when every candidate has been tried.
+        """
+        with self.lock:
+            now = time.monotonic()
+            remaining = [e for e in candidates if e.name not in tried]
+            if not remaining:
+                return None, None
+            available = [e for e in remaining if e.wait_time(now) == 0]
+            if available:
+                endpoint = min(available, key=lambda e: e.load(now))
+                endpoint.in_flight += 1
+                return endpoint, 0
+            return None, min(min(e.wait_time(now) for e in remaining), 1.0)
+
+    def acquire(self, candidates, tried):
+        """
+        Waits for an available candidate. Returns None when every candidate has been tried.
+        """
+        while True:
+            endpoint, wait = self.try_acquire(candidates, tried)
+            if endpoint is not None or wait is None:
+                return endpoint
+            time.sleep(wait)
+
+    async def async_acquire(self, candidates, tried):
+        while True:
+            endpoint, wait = self.try_acquire(candidates, tried)
+            if endpoint is not None or wait is None:
+                return endpoint
+            await asyncio.sleep(wait)
+
+    def release(self, endpoint, tokens=None, error=None):
+        with self.lock:
+            now = time.monotonic()
+            endpoint.in_flight -= 1
+            endpoint.calls += 1
+            if error is None:
+                endpoint.events.append((now, tokens or 0))
+                endpoint.rate_limits_in_row = 0
+            elif isinstance(error, openai.RateLimitError):
+                endpoint.events.append((now, 0))
+                endpoint.rate_limited += 1
+                endpoint.rate_limits_in_row += 1
+                backoff = min(self.backoff_max, self.backoff_min * 2 ** (endpoint.rate_limits_in_row - 1))
+                endpoint.cooldown_until = now + backoff * random.uniform(0.5, 1.0)
+            elif isinstance(error, FAILOVER_ERRORS):
+                endpoint.failures += 1
+                endpoint.cooldown_until = now + self.backoff_min
+
+    def candidates(self, kwargs, files=False):
+        pinned = self.pinned_endpoint(kwargs)
+        if pinned is not None:
+            return [pinned]
+        return [e for e in self.endpoints if e.files or not files]
+
+    def endpoint_kwargs(self, endpoint, kwargs):
+        call_kwargs = dict(kwargs)
+        if "model" in call_kwargs:
+            call_kwargs["model"] = endpoint.model_map.get(call_kwargs["model"], call_kwargs["model"])
+        return call_kwargs
+
+    def handle_error(self, endpoint, error):
+        """
+        Releases the endpoint after an error. Returns True when the call may fail over.
+        """
+        self.release(endpoint, error=error)
+        if isinstance(error, openai.RateLimitError):
+            logger.info(f"Endpoint {endpoint.name} rate limited, backing off.")
+            return True
+        if isinstance(error, FAILOVER_ERRORS):
+            logger.info(f"Endpoint {endpoint.name} failed ({type(error).__name__}), failing over.")
+            return True
+        return False
+
+    def call(self, function, kwargs, total=None, files=False):
+        """
+        Routes one call. `function(endpoint, **kwargs)` performs the request on the given endpoint.
+        Output: (response, endpoint). Raises the last error when every candidate endpoint failed.
+        Calls other than uploads are admitted by the scheduler first, when one is set.
+        """
+        ticket = self.scheduler.submit(kwargs) if self.scheduler is not None and not files else None
+        try:
+            response, endpoint = self._call(function, kwargs, total, files)
+        except Exception:
+            if ticket is not None:
+                self.scheduler.complete(ticket)
+            raise
+        if ticket is not None:
+            self.scheduler.complete(ticket, _total_tokens(response))
+        return response, endpoint
+
+    def _call(self, function, kwargs, total, files):
+        candidates = self.candidates(kwargs, files)
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = self.acquire(candidates, tried)
+            if endpoint is None:
+                raise last_error or RuntimeError("No endpoint of the pool can take this call.")
+            try:
+                response = self.deadline.call(total, function, endpoint, **self.endpoint_kwargs(endpoint, kwargs))
+            except Exception as e:
+                if not self.handle_error(endpoint, e):
+                    raise
+                tried.add(endpoint.name)
+                last_error = e
+                continue
+            self.release(endpoint, tokens=_total_tokens(response))
+            if kwargs.get("store") and getattr(response, "id", None):
+                self.pin_response(response.id, endpoint)  # follow-up calls chain on this endpoint.
+            return response, endpoint
+
+    async def async_call(self, function, kwargs, total=None, files=False):
+        """
+        Async counterpart of call, `function(endpoint, **kwargs)` returns an awaitable.
+        Used for hedged calls: cancelling the task closes the request and releases the endpoint and ticket.
+        The scheduler's file-locked transactions run on the default executor, so they don't block the event loop.
+        """
+        ticket = await self.scheduler.async_submit(kwargs) if self.scheduler is not None and not files else None
+        try:
+            response, endpoint = await self._async_call(function, kwargs, total, files)
+        except asyncio.CancelledError:
+            if ticket is not None:
+                await self._async_complete(ticket, None)  # cancelled hedge, its usage is unknown.
+            raise
+        except Exception:
+            if ticket is not None:
+                await self._async_complete(ticket)
+            raise
+        if ticket is not None:
+            await self._async_complete(ticket, _total_tokens(response))
+        return response, endpoint
+
+    async def _async_complete(self, ticket, tokens=0):
+        await asyncio.get_running_loop().run_in_executor(None, self.scheduler.complete, ticket, tokens)
+
+    async def _async_call(self, function, kwargs, total, files):
+        candidates = self.candidates(kwargs, files)
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = await self.async_acquire(candidates, tried)
+            if endpoint is None:
+                raise last_error or RuntimeError("No endpoint of the pool can take this call.")
+            try:
+                response = await asyncio.wait_for(function(endpoint, **self.endpoint_kwargs(endpoint, kwargs)), total)
+            except asyncio.CancelledError:
+                self.release(endpoint)  # cancelled by the caller, the request may have been billed.
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"API call exceeded the total timeout of {total} seconds.")
+                if not self.handle_error(endpoint, e):
+                    raise e
+                tried.add(endpoint.name)
+                last_error = e
+                continue
+            self.release(endpoint, tokens=_total_tokens(response))
+            if kwargs.get("store") and getattr(response, "id", None):
+                self.pin_response(response.id, endpoint)  # follow-up calls chain on this endpoint.
+            return response, endpoint
+
+    def summary(self):
+        with self.lock:
+            return "Endpoints: " + "; ".join(
+                f"{e.name} {e.calls} calls, {e.rate_limited} rate limited, {e.failures} failed"
+                for e in self.endpoints)
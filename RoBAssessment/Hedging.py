@@ -0,0 +1,158 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+"""
+Hedged requests to cut tail latency.
+When a call runs longer than a rolling latency percentile of its model, a duplicate is issued and
+whichever returns first is used; the other one is cancelled. The number of hedges is capped at a
+fraction of all calls.
+Only the blocking create / parse calls are hedged; streamed calls are not (their early decision is
+already reported while the stream runs, and a duplicate stream would double its tokens).
+"""
+
+logger = logging.getLogger("logger")
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q / 100.0 * len(values))) - 1))
+    return values[index]
+
+class Hedger:
+    def __init__(self, enabled=False, percentile=95, budget=0.1, min_samples=20, window=200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget  # maximum fraction of calls that may be hedged.
+        self.min_samples = min_samples  # latencies needed before a model is hedged.
+        self.window = window
+        self.latencies = {}  # {key: deque of attempt latencies}
+        self.lock = threading.Lock()
+        self.loop = None  # event loop of the hedged calls, on its own thread.
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the run statistics, the rolling latencies are kept.
+        """
+        with self.lock:
+            self.calls = 0
+            self.hedged = 0
+            self.hedge_wins = 0
+            self.primaries_cancelled = 0
+            self.primary_latencies = []  # latency each call would have had without hedging (lower bound when cancelled).
+            self.effective_latencies = []  # latency seen by the caller.
+
+    def threshold(self, key):
+        with self.lock:
+            latencies = self.latencies.get(key)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            return percentile(latencies, self.percentile)
+
+    def _record(self, key, seconds):
+        with self.lock:
+            self.latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    async def _timed(self, key, coroutine):
+        started = time.monotonic()
+        try:
+            result = await coroutine
+        except asyncio.CancelledError:
+            self._record(key, time.monotonic() - started)  # lower bound, keeps the slow tail in the window.
+            raise
+        self._record(key, time.monotonic() - started)
+        return result
+
+    def _event_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="hedge-loop", daemon=True).start()
+            return self.loop
+
+    def call(self, key, function, async_function):
+        """
+        Runs a call, hedged with a duplicate when it exceeds the latency percentile of `key`.
+        function() is the plain call, used when the call can't be hedged (hedging disabled, too few latencies
+        of `key` or no hedge budget left). async_function() returns a new coroutine of the same call; hedgeable
+        calls run on the async clients, so the slower call is cancelled and its connection closed.
+        """
+        if not self.enabled:
+            return function()
+        with self.lock:
+            self.calls += 1
+        if self.threshold(key) is None or not self._has_budget():
+            return self._run(key, function)
+        return asyncio.run_coroutine_threadsafe(self._race(key, async_function), self._event_loop()).result()
+
+    def _run(self, key, function):
+        """
+        Runs a call that isn't hedged on the calling thread, recording its latency.
+        """
+        started = time.monotonic()
+        result = function()
+        elapsed = time.monotonic() - started
+        self._record(key, elapsed)
+        with self.lock:
+            self.effective_latencies.append(elapsed)
+            self.primary_latencies.append(elapsed)
+        return result
+
+    async def _race(self, key, async_function):
+        started = time.monotonic()
+        threshold = self.threshold(key)
+        primary = asyncio.ensure_future(self._timed(key, async_function()))
+        pending = {primary}
+        if threshold is not None:
+            done, _ = await asyncio.wait(pending, timeout=threshold)
+            if not done and self._may_hedge():
+                logger.info(f"Hedging a {key} call after {threshold:.1f}s.")
+                pending.add(asyncio.ensure_future(self._timed(key, async_function())))
+
+        errors = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                for loser in pending:
+                    loser.cancel()  # closes the loser's HTTP request and releases its endpoint / ticket.
+                elapsed = time.monotonic() - started
+                with self.lock:
+                    self.effective_latencies.append(elapsed)
+                    if task is not primary:
+                        self.hedge_wins += 1
+                    if task is primary or primary in pending:
+                        self.primary_latencies.append(elapsed)  # a cancelled primary would have taken at least this.
+                    if primary in pending:
+                        self.primaries_cancelled += 1
+                return task.result()
+        raise errors[0]
+
+    def _has_budget(self):
+        with self.lock:
+            return self.hedged + 1 <= self.budget * self.calls
+
+    def _may_hedge(self):
+        with self.lock:
+            if self.hedged + 1 > self.budget * self.calls:
+                return False
+            self.hedged += 1
+            return True
+
+    def summary(self):
+        with self.lock:
+            if not self.enabled:
+                return "Hedging: disabled."
+            primary = percentile(self.primary_latencies, 99)
+            effective = percentile(self.effective_latencies, 99)
+            text = (f"Hedging: {self.hedged} of {self.calls} calls hedged "
+                    f"({self.hedged * 100 / max(1, self.calls):.1f}%), {self.hedge_wins} won by the hedge.")
+            if primary is not None and effective is not None:
+                text += (f" p99 latency {effective:.1f}s (without hedging at least {primary:.1f}s, "
+                         f"{self.primaries_cancelled} slow primaries cancelled).")
+            return text
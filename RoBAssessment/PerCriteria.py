@@ -1,9 +1,15 @@
 import os
 import time
 import openai
+import functools
+import threading
+import concurrent.futures
 from typing import List
 from pydantic import BaseModel, Field
 from RoBAssessment import Assessment as assess
+from RoBAssessment import Dedup
+from RoBAssessment import Progress
+from RoBAssessment import Pipeline
 from tenacity import retry, wait_exponential, retry_if_exception_type
 
 # Pydantic Class for Structured Output.
@@ -13,7 +19,15 @@ class AssessmentResultPerCriteria(BaseModel):
     Each field requires explanation to guide the LLM in output generation.
     """
     explanation: str = Field(..., description="A detailed reasoning that supports the decision, based on evidence from the document.")
-    result: str = Field(..., description="The overall decision for this item. Respond only with one of ['yes', 'no'].")
+    result: assess.Decision = Field(..., description="The overall decision for this item. Respond only with one of ['yes', 'no'].")
+
+class AssessmentResultDecisionFirst(BaseModel):
+    """
+    Output format for the streaming mode. The decision comes first, so it can be used
+    before the explanation is complete.
+    """
+    result: assess.Decision = Field(..., description="The overall decision for this item. Respond only with one of ['yes', 'no'].")
+    explanation: str = Field(..., description="A detailed reasoning that supports the decision, based on evidence from the document.")
 
 ### Methods ###
 def process_plain_text():
@@ -22,91 +36,15 @@ def process_plain_text():
     Input: NA.
     Output: NA.
     """
-    # Initialize output containers
-    assessment_notes: List[str] = []
-    assessment_notes.append(assess.notes_header)
-    assessment_notes.append("Assessing plain files locally. Assessing one criteria at a time for one paper.")
-    assessment_summary: List[List[str]] = [assess.summary_header]
-    assess.print_and_log("Assessing plain files locally. Assessing one criteria at a time for one paper.")
-
-    if assess.robust_mode == True:
-        assessment_notes_raw: List[str] = []
-        assessment_notes_raw.append(assess.notes_header)
-        assessment_notes_raw.append("Raw notes. Assessing plain files locally. Assessing one criteria at a time for one paper.")
-    else:
-        assessment_notes_raw = None
-
-    # token counter for all papers.
-    tokens_all_papers = 0
-
-    # Loop for one paper.
     # Get only .txt and .md files
     plain_text_files = [
         f for f in sorted(os.listdir(assess.plain_text_input_folder))
         if f.lower().endswith((".txt", ".md"))
     ]
-    pdfs_count = len(plain_text_files)
-    for i, file_name in enumerate(plain_text_files):
-        assess.print_and_log(f"Processing plain text: File {i + 1}/{pdfs_count}. Filename: {file_name}")
-
-        # Initialize note.
-        note_entry = ""
-        note_entry += (f"\n=== Paper {i + 1}: {file_name} ===\n")
-        csv_entry = ""
-        # Raw note.
-        raw_note_entry = ""
-
-        # token counter for this paper.
-        tokens_this_paper = 0
-
-        # Open markdown file.
-        with open(os.path.join(assess.plain_text_input_folder, file_name), "r", encoding="utf-8") as f:
-            document = f.read()
-
-        for criteria_id, sub_crit_dict in assess.nested_subs.items():
-            for sub_crit_id, sub_crit in sub_crit_dict.items():
-                sub_criteria_prompt = sub_crit["explanation"]
-
-                try:
-                    if assess.robust_mode == True:
-                        structured_response, response = call_openai_response_api_plain_text_input_robust(sub_criteria_prompt, document,
-                                                                                    AssessmentResultPerCriteria)
-                    else:
-                        structured_response = call_openai_response_api_plain_text_input(sub_criteria_prompt, document,
-                                                                                        AssessmentResultPerCriteria)
-                except Exception as e:
-                    exception = f"Error: {e}. Error prccessing {file_name}"
-                    note_entry += f"\n{exception}\n"
-                    assess.print_and_log(f"Processing Error. Exception: {exception}")
-                    continue
-
-                # Reasoning field.
-                note_entry += (f"\n{sub_crit_id}) {sub_crit['title']} = {structured_response.output_parsed.result}\n"
-                               f"\n{structured_response.output_parsed.explanation}\n")
-                # Raw unparsed notes.
-                if assess.robust_mode == True:
-                    raw_note_entry += (f"\n{sub_crit_id}) {sub_crit['title']}:\n"
-                                   f"\n{response.output_text}\n")
-                # Append csv entry.
-                csv_entry += (f"{structured_response.output_parsed.result},") # comma at the end.
-
-                # Responses tokens.
-                tokens_this_paper += structured_response.usage.total_tokens
-                time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
-
-        assess.print_and_log(f"This paper ({file_name}) consumed {tokens_this_paper} tokens.")
-        tokens_all_papers += tokens_this_paper
-
-        assessment_notes.append(note_entry)
-        if assess.robust_mode == True:
-            assessment_notes_raw.append(raw_note_entry)
-        full_row = [str(i + 1), file_name] + [p for p in csv_entry.split(",") if p]
-        assessment_summary.append(full_row)
-
-    assess.print_and_log("Processed " + str(pdfs_count) + " papers.")
-    assess.print_and_log("Consumed "+str(tokens_all_papers) +" tokens for "+str(pdfs_count)+" papers.")
-    # Save outputs
-    assess.save_outputs(assessment_notes, assessment_summary, assessment_notes_raw)
+    # Assess one representative per cluster of duplicates.
+    clusters = Dedup.cluster_plain_text_files(plain_text_files)
+    run_assessment("Assessing plain files locally. Assessing one criteria at a time for one paper.",
+                   "PerCriteria plain text", clusters, Pipeline.load_plain_text)
 
 def process_pdf_stored_in_cloud(file_dict):
     """
@@ -114,83 +52,315 @@ def process_pdf_stored_in_cloud(file_dict):
     Input: {file_name: file_id} dictionary.
     Output: NA.
     """
+    # Assess one representative per cluster of duplicates.
+    clusters = Dedup.cluster_pdf_files(file_dict)
+    run_assessment("Assessing PDFs stored in cloud. Assessing one criteria at a time for one paper.",
+                   "PerCriteria pdf", clusters, Pipeline.load_stored_pdf(file_dict))
+
+def process_pdf_local():
+    """
+    Uploads the local pdfs and assesses them as soon as each upload is done. Saves assessment output files.
+    Input: NA.
+    Output: NA.
+    """
+    pdf_files = assess.list_pdf_files()
+    # Duplicates are neither uploaded nor assessed.
+    clusters = Dedup.cluster_pdf_files(dict.fromkeys(pdf_files, ""))
+    run_assessment("Uploading and assessing local PDFs. Assessing one criteria at a time for one paper.",
+                   "PerCriteria pdf", clusters, Pipeline.load_local_pdf)
+
+def run_assessment(description, label, clusters, load):
+    """
+    Runs the assessment pipeline over the cluster representatives and saves the output files.
+    Input: description (string), progress label (string), clusters dictionary, Pipeline loader.
+    Output: NA.
+    """
     # Initialize output containers
     assessment_notes: List[str] = []
     assessment_notes.append(assess.notes_header)
-    assessment_notes.append("Assessing PDFs stored in cloud. Assessing one criteria at a time for one paper.")
+    assessment_notes.append(description)
     assessment_summary: List[List[str]] = [assess.summary_header]
-    assess.print_and_log("Assessing PDFs stored in cloud. Assessing one criteria at a time for one paper.")
+    assess.print_and_log(description)
 
     if assess.robust_mode == True:
         assessment_notes_raw: List[str] = []
         assessment_notes_raw.append(assess.notes_header)
-        assessment_notes_raw.append("Raw notes. Assessing plain files locally. Assessing one criteria at a time for one paper.")
+        assessment_notes_raw.append("Raw notes. " + description)
     else:
         assessment_notes_raw = None
 
-    # Initialize token counter for all papers.
+    # token counter for all papers.
     tokens_all_papers = 0
-
-    pdfs_count = len(file_dict.keys())
-    for i, file_name in enumerate(sorted(file_dict.keys())):  # sorted in ascending order.
-        assess.print_and_log(f"Processing pdf file: File {i + 1}/{pdfs_count}. Filename: {file_name}")
-        file_id = file_dict[file_name]
-
-        note_entry = ""
-        note_entry += f"\n=== Paper {i + 1}: {file_name} ===\n"
-        csv_entry = ""
-        raw_note_entry = ""
-
-        # tokens for this paper
-        tokens_this_paper = 0
-
-        # Loop over criterion.
-        for criteria_id, sub_crit_dict in assess.nested_subs.items():
-            for sub_crit_id, sub_crit in sub_crit_dict.items():
-                sub_criteria_prompt = sub_crit["explanation"]
-
-                try:
-                    if assess.robust_mode == True:
-                        structured_response, response = call_openai_response_api_file_upload_robust(sub_criteria_prompt,
-                                                                                   file_id, AssessmentResultPerCriteria)
-                    else:
-                        structured_response = call_openai_response_api_file_upload(sub_criteria_prompt,
-                                                                                   file_id, AssessmentResultPerCriteria)
-                except Exception as e:
-                    exception = f"Error: {e}. Error prccessing {file_name}"
-                    note_entry += f"\n{exception}\n"
-                    assess.print_and_log(f"Processing Error. Exception: {exception}")
-                    continue
-
-                # Reasoning field.
-                note_entry += (f"\n{sub_crit_id}) {sub_crit['title']} = {structured_response.output_parsed.result}\n"
-                               f"\n{structured_response.output_parsed.explanation}\n")
-                # Raw unparsed notes.
-                if assess.robust_mode == True:
-                    raw_note_entry += (f"\n{sub_crit_id}) {sub_crit['title']}:\n"
-                                   f"\n{response.output_text}\n")
-                # Append csv entry.
-                csv_entry += (f"{structured_response.output_parsed.result},")  # comma at the end.
-                # Responses tokens.
-                tokens_this_paper += structured_response.usage.total_tokens
-
-                time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
-
-        assess.print_and_log(f"This paper ({file_name}) consumed {tokens_this_paper} tokens.")
+    bytes_all_papers = 0
+
+    file_names = sorted(clusters.keys())  # sorted in ascending order.
+    pdfs_count = len(file_names)
+    Progress.start_run(label, planned_requests(pdfs_count))
+    try:
+        results = Pipeline.run(file_names, load, functools.partial(assess_paper, pdfs_count=pdfs_count))
+    finally:
+        Progress.end_run()
+
+    for i, (file_name, result) in enumerate(zip(file_names, results)):
+        if isinstance(result, Exception):
+            assessment_notes.append(f"\n=== Paper {i + 1}: {file_name} ===\n\nError: {result}. Error prccessing {file_name}\n")
+            continue
+        note_entry, raw_note_entry, full_row, tokens_this_paper, bytes_this_paper = result
         tokens_all_papers += tokens_this_paper
-
+        bytes_all_papers += bytes_this_paper
         assessment_notes.append(note_entry)
         if assess.robust_mode == True:
             assessment_notes_raw.append(raw_note_entry)
-        full_row = [str(i + 1), file_name] + [p for p in csv_entry.split(",") if p]
         assessment_summary.append(full_row)
 
     assess.print_and_log("Processed " + str(pdfs_count) + " papers.")
-    assess.print_and_log("Consumed " + str(tokens_all_papers) + " for " + str(pdfs_count) + " papers.")
+    assess.print_and_log("Consumed "+str(tokens_all_papers) +" tokens for "+str(pdfs_count)+" papers.")
+    assess.print_and_log("Sent "+str(bytes_all_papers) +" bytes of requests for "+str(pdfs_count)+" papers.")
+    assessment_summary = Dedup.fan_out_duplicates(assessment_summary, assessment_notes, clusters)
     # Save outputs
     assess.save_outputs(assessment_notes, assessment_summary, assessment_notes_raw)
 
+def planned_requests(papers):
+    """
+    API requests planned for assessing `papers` papers: every sub criteria, plus the request
+    starting the conversation of each paper in Conversation Mode.
+    """
+    per_paper = assess.sub_criteria_count * Progress.requests_per_item(assess.streaming_mode)
+    return papers * (per_paper + (1 if assess.conversation_mode == True else 0))
+
+def assess_paper(i, file_name, pdfs_count, document=None, file_id=None, **loaded):
+    """
+    Assess one paper criteria by criteria, given either as plain text (document) or stored in the cloud (file_id).
+    Input: paper index, file name, number of papers, document (string) or file_id (string).
+    Output: (note_entry, raw_note_entry, summary row, tokens consumed, request bytes sent).
+    """
+    assess.set_log_context(paper=file_name)
+    if document is not None:
+        assess.print_and_log(f"Processing plain text: File {i + 1}/{pdfs_count}. Filename: {file_name}")
+    else:
+        assess.print_and_log(f"Processing pdf file: File {i + 1}/{pdfs_count}. Filename: {file_name}")
+
+    # Initialize note.
+    note_entry = ""
+    note_entry += (f"\n=== Paper {i + 1}: {file_name} ===\n")
+    csv_entry = ""
+    # Raw note.
+    raw_note_entry = ""
+
+    # token counter for this paper.
+    tokens_this_paper = 0
+    assess.reset_request_stats()
+
+    # Conversation mode: send the paper once, the sub criteria follow up on this response.
+    conversation = {"id": None}
+    stored_response_id = None
+    if assess.conversation_mode == True:
+        started = Progress.request_started()
+        try:
+            context_response = call_openai_response_api_start_conversation(document, file_id)
+        except Exception as e:
+            Progress.request_failed(started)
+            assess.print_and_log(f"Conversation state not available ({e}), assessing {file_name} statelessly.")
+        else:
+            Progress.request_finished(started, context_response.usage.total_tokens)
+            conversation["id"] = stored_response_id = context_response.id
+            tokens_this_paper += context_response.usage.total_tokens
+
+    # Loop over criterion.
+    items = [(sub_crit_id, sub_crit) for sub_crit_dict in assess.nested_subs.values()
+             for sub_crit_id, sub_crit in sub_crit_dict.items()]
+    if assess.streaming_mode == True:
+        results = assess_decision_first(items, file_name, document, file_id, conversation)
+    else:
+        results = []
+        for sub_crit_id, sub_crit in items:
+            results.append(assess_sub_criteria(sub_crit_id, sub_crit, file_name, document, file_id, conversation))
+            time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
+    assess.set_log_context(criterion=None)
+    if stored_response_id is not None and assess.keep_conversations != True:
+        assess.delete_stored_response(stored_response_id)
+
+    for (sub_crit_id, sub_crit), result in zip(items, results):
+        if isinstance(result, Exception):
+            note_entry += f"\nError: {result}. Error prccessing {file_name}\n"
+            continue
+        structured_response, response = result
+        # Reasoning field.
+        note_entry += (f"\n{sub_crit_id}) {sub_crit['title']} = {structured_response.output_parsed.result}\n"
+                       f"\n{structured_response.output_parsed.explanation}\n")
+        # Raw unparsed notes.
+        if assess.robust_mode == True:
+            raw_note_entry += (f"\n{sub_crit_id}) {sub_crit['title']}:\n"
+                           f"\n{response.output_text}\n")
+        # Append csv entry.
+        csv_entry += (f"{structured_response.output_parsed.result},") # comma at the end.
+
+        # Responses tokens.
+        tokens_this_paper += structured_response.usage.total_tokens
+
+    bytes_this_paper = assess.get_request_bytes()
+    assess.print_and_log(f"This paper ({file_name}) consumed {tokens_this_paper} tokens, "
+                         f"sent {bytes_this_paper} bytes ({'conversation' if conversation['id'] else 'stateless'}).")
+
+    full_row = [str(i + 1), file_name] + [p for p in csv_entry.split(",") if p]
+    return note_entry, raw_note_entry, full_row, tokens_this_paper, bytes_this_paper
+
+def assess_sub_criteria(sub_crit_id, sub_crit, file_name, document, file_id, conversation, decided=None):
+    """
+    Assess one sub criteria, chained on the conversation when there is one, and report it to the progress display.
+    decided (threading.Event) is set once the decision is known.
+    Output: (structured response, raw response), or the exception when the assessment failed.
+    """
+    assess.set_log_context(criterion=sub_crit_id)
+    sub_criteria_prompt = sub_crit["explanation"]
+    started = Progress.request_started()
+    on_decision = functools.partial(report_decision, sub_crit_id, started, decided)
+    try:
+        result = None
+        if conversation["id"] is not None:
+            try:
+                result = call_sub_criteria(sub_criteria_prompt, None, None, conversation["id"], on_decision)
+            except (openai.BadRequestError, openai.NotFoundError) as e:
+                assess.print_and_log(f"Chaining failed ({e}), continuing {file_name} without conversation state.")
+                conversation["id"] = None
+        if result is None:
+            result = call_sub_criteria(sub_criteria_prompt, document, file_id, None, on_decision)
+    except Exception as e:
+        Progress.request_failed(started, Progress.requests_per_item(assess.streaming_mode))
+        assess.print_and_log(f"Processing Error. Exception: Error: {e}. Error prccessing {file_name}")
+        return e
+    finally:
+        if decided is not None:
+            decided.set()
+    Progress.request_finished(started, result[0].usage.total_tokens, Progress.requests_per_item(assess.streaming_mode))
+    return result
+
+def assess_decision_first(items, file_name, document, file_id, conversation):
+    """
+    Streaming mode: each sub criteria starts as soon as the decision of the previous one has arrived,
+    while the explanation of the previous one is still streaming.
+    Output: list of results of assess_sub_criteria, in the order of items.
+    """
+    def run(sub_crit_id, sub_crit, decided):
+        assess.reset_request_stats()
+        result = assess_sub_criteria(sub_crit_id, sub_crit, file_name, document, file_id, conversation, decided)
+        return result, assess.get_request_bytes(), assess.get_request_count()
+
+    futures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(items)),
+                                               thread_name_prefix=threading.current_thread().name) as executor:
+        for sub_crit_id, sub_crit in items:
+            decided = threading.Event()
+            futures.append(executor.submit(assess.in_log_context(run), sub_crit_id, sub_crit, decided))
+            decided.wait()
+            time.sleep(assess.sleep_time)  # prevent TPM rate limit error, in second.
+    results = []
+    for future in futures:
+        result, bytes_sent, requests = future.result()
+        assess.add_request_stats(bytes_sent, requests)  # counted on the worker threads.
+        results.append(result)
+    return results
+
+def call_sub_criteria(sub_criteria_prompt, document, file_id, previous_response_id, on_decision):
+    """
+    Assess one sub criteria with the configured mode: streaming, chained on a conversation, or stateless
+    with the document (plain text) or file_id (pdf).
+    Output: (structured response, raw response).
+    """
+    if assess.streaming_mode == True:
+        structured_response = call_openai_response_api_streaming(sub_criteria_prompt, document, file_id, on_decision,
+                                                                 previous_response_id)
+        return structured_response, structured_response
+    if previous_response_id is not None:
+        if assess.robust_mode == True:
+            return call_openai_response_api_chained_robust(sub_criteria_prompt, previous_response_id,
+                                                           AssessmentResultPerCriteria)
+        structured_response = call_openai_response_api_chained(sub_criteria_prompt, previous_response_id,
+                                                               AssessmentResultPerCriteria)
+        return structured_response, structured_response
+    if document is not None:
+        if assess.robust_mode == True:
+            return call_openai_response_api_plain_text_input_robust(sub_criteria_prompt, document,
+                                                                    AssessmentResultPerCriteria)
+        structured_response = call_openai_response_api_plain_text_input(sub_criteria_prompt, document,
+                                                                        AssessmentResultPerCriteria)
+        return structured_response, structured_response
+    if assess.robust_mode == True:
+        return call_openai_response_api_file_upload_robust(sub_criteria_prompt, file_id, AssessmentResultPerCriteria)
+    structured_response = call_openai_response_api_file_upload(sub_criteria_prompt, file_id, AssessmentResultPerCriteria)
+    return structured_response, structured_response
+
+def report_decision(sub_crit_id, started, decided, decision, seconds):
+    """
+    Called by the streaming mode as soon as the decision of a sub criteria is generated;
+    the next sub criteria may start from here on.
+    """
+    Progress.request_decided(started)
+    assess.print_and_log(f"Decision {sub_crit_id} = {decision} after {seconds:.1f}s.")
+    if decided is not None:
+        decided.set()
+
 ### API Calls ###
+@retry(wait=wait_exponential(multiplier=assess.retry_multiplier, min=assess.retry_min, max=assess.retry_max),
+       retry=retry_if_exception_type(openai.RateLimitError))
+@retry(retry=retry_if_exception_type(openai.APIConnectionError))
+def call_openai_response_api_streaming(messages, document, file_id, on_decision, previous_response_id=None):
+    """
+    Function to call OpenAI API (Structured Output, streamed), decision first. For files parsed locally (document),
+    stored in OpenAI platform (file_id) or already sent in a previous response (previous_response_id).
+    :param messages: messages (prompt, string), document (string) or file_id (string), on_decision (callback).
+    :return: AssessmentResultDecisionFirst
+    """
+    chain = {}
+    if previous_response_id is not None:
+        chain["previous_response_id"] = previous_response_id
+        content = [
+            {
+                "type": "input_text",
+                "text": messages,
+            }
+        ]
+    elif document is not None:
+        content = [
+            {
+                "type": "input_text",
+                "text": f"{messages}\n"
+            },
+            {
+                "type": "input_text",
+                "text": f"\nHere is the paper:\n{document}"
+            }
+        ]
+    else:
+        content = [
+            {
+                "type": "input_text",
+                "text": messages,
+            },
+            {
+                "type": "input_file",
+                "file_id": file_id
+            }
+        ]
+
+    response = assess.stream_response(
+        on_decision=on_decision,
+        explanation_token_limit=assess.explanation_token_limit,
+        model=assess.model_name,
+        temperature=assess.model_temperature,
+        instructions=assess.intro_prompt,
+        input=[
+            {
+                "role": "user",
+                "content": content
+            },
+        ],
+        text_format=AssessmentResultDecisionFirst,
+        **chain,
+    )
+
+    return response
+
 @retry(wait=wait_exponential(multiplier=assess.retry_multiplier, min=assess.retry_min, max=assess.retry_max),
        retry=retry_if_exception_type(openai.RateLimitError))
 @retry(retry=retry_if_exception_type(openai.APIConnectionError))
@@ -200,7 +370,7 @@ def call_openai_response_api_plain_text_input(messages, document, output_format)
     :param messages: messages (prompt, string), document (string), output_format (pydantic class).
     :return: AssessmentResult
     """
-    response = assess.client.responses.parse(
+    response = assess.parse_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_prompt,
@@ -229,7 +399,7 @@ def call_openai_response_api_plain_text_input(messages, document, output_format)
 @retry(retry=retry_if_exception_type(openai.APIConnectionError))
 def call_openai_response_api_plain_text_input_robust(messages, document, output_format):
 
-    response = assess.client.responses.create(
+    response = assess.create_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_prompt,
@@ -263,7 +433,7 @@ def call_openai_response_api_file_upload(messages, file_id, output_format):
     :param messages: messages (prompt, string), file_id (string).
     :return: AssessmentResult
     """
-    response = assess.client.responses.parse(
+    response = assess.parse_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_prompt,
@@ -296,7 +466,7 @@ def call_openai_response_api_file_upload_robust(messages, file_id, output_format
     :param messages: messages (prompt, string), file_id (string).
     :return: AssessmentResult
     """
-    response = assess.client.responses.create(
+    response = assess.create_response(
         model=assess.model_name,
         temperature=assess.model_temperature,
         instructions=assess.intro_prompt,
@@ -320,3 +490,110 @@ def call_openai_response_api_file_upload_robust(messages, file_id, output_format
     parsed = assess.call_parser(response, output_format)
     parsed.usage.total_tokens = parsed.usage.total_tokens + response.usage.total_tokens
     return parsed, response
+
+@retry(wait=wait_exponential(multiplier=assess.retry_multiplier, min=assess.retry_min, max=assess.retry_max),
+       retry=retry_if_exception_type(openai.RateLimitError))
+@retry(retry=retry_if_exception_type(openai.APIConnectionError))
+def call_openai_response_api_start_conversation(document, file_id):
+    """
+    Function to call OpenAI API, sends the paper once and stores the response, so the sub criteria can be
+    chained on it with previous_response_id.
+    :param messages: document (string) or file_id (string).
+    :return: Response
+    """
+    if document is not None:
+        paper = {
+            "type": "input_text",
+            "text": f"\nHere is the paper:\n{document}"
+        }
+    else:
+        paper = {
+            "type": "input_file",
+            "file_id": file_id
+        }
+
+    response = assess.create_response(
+        model=assess.model_name,
+        temperature=assess.model_temperature,
+        instructions=assess.intro_prompt,
+        input=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": "Read the following paper. The assessment items follow in the next messages. "
+                                "Reply only with \"ready\".\n"
+                    },
+                    paper
+                ]
+            },
+        ],
+        max_output_tokens=16,
+        store=True,
+    )
+
+    return response
+
+@retry(wait=wait_exponential(multiplier=assess.retry_multiplier, min=assess.retry_min, max=assess.retry_max),
+       retry=retry_if_exception_type(openai.RateLimitError))
+@retry(retry=retry_if_exception_type(openai.APIConnectionError))
+def call_openai_response_api_chained(messages, previous_response_id, output_format):
+    """
+    Function to call OpenAI API (Structured Output), chained on the stored response holding the paper.
+    :param messages: messages (prompt, string), previous_response_id (string), output_format (pydantic class).
+    :return: AssessmentResult
+    """
+    response = assess.parse_response(
+        model=assess.model_name,
+        temperature=assess.model_temperature,
+        instructions=assess.intro_prompt,
+        previous_response_id=previous_response_id,
+        input=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": messages,
+                    }
+                ]
+            },
+        ],
+        text_format=output_format,
+        store=False,
+    )
+
+    return response
+
+@retry(wait=wait_exponential(multiplier=assess.retry_multiplier, min=assess.retry_min, max=assess.retry_max),
+       retry=retry_if_exception_type(openai.RateLimitError))
+@retry(retry=retry_if_exception_type(openai.APIConnectionError))
+def call_openai_response_api_chained_robust(messages, previous_response_id, output_format):
+    """
+    Function to call OpenAI API, chained on the stored response holding the paper. Uses two-step prompting.
+    :param messages: messages (prompt, string), previous_response_id (string), output_format (pydantic class).
+    :return: AssessmentResult
+    """
+    response = assess.create_response(
+        model=assess.model_name,
+        temperature=assess.model_temperature,
+        instructions=assess.intro_prompt,
+        previous_response_id=previous_response_id,
+        input=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": messages,
+                    }
+                ]
+            },
+        ],
+        store=False,
+    )
+
+    parsed = assess.call_parser(response, output_format)
+    parsed.usage.total_tokens = parsed.usage.total_tokens + response.usage.total_tokens
+    return parsed, response
@@ -0,0 +1,120 @@
+import os
+import queue
+import hashlib
+import threading
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Preprocess
+"""
+Staged producer / consumer pipeline for assessment runs.
+A loader thread prepares paper N+k (read, hash, preprocess or upload) while the
+assessment workers work on paper N. Stages are connected by bounded queues, so the
+loader stays at most PrefetchDepth papers ahead of the assessment.
+"""
+
+_DONE = object()
+
+### Loaders ###
+
+def load_plain_text(file_name):
+    """
+    Reads a plain text paper, hashes it and preprocesses it (when enabled).
+    The hash of the raw file keys the preprocessing cache and the benchmark recordings.
+    Output: {"document": ..., "sha256": ...}
+    """
+    with open(os.path.join(assess.plain_text_input_folder, file_name), "r", encoding="utf-8") as f:
+        document = f.read()
+    sha256 = hashlib.sha256(document.encode("utf-8")).hexdigest()
+    if assess.preprocessing:
+        document = Preprocess.preprocess(document, sha256, file_name)[0]
+    return {
+        "document": document,
+        "sha256": sha256,
+    }
+
+def load_stored_pdf(file_dict):
+    """
+    Loader for pdfs already stored in the cloud.
+    Input: {file_name: file_id} dictionary.
+    """
+    def load(file_name):
+        return {"file_id": file_dict[file_name]}
+    return load
+
+def load_local_pdf(file_name):
+    """
+    Uploads a local pdf, so its assessment can start as soon as the upload is done.
+    Output: {"file_id": ...}
+    """
+    return {"file_id": assess.upload_pdf(file_name)}
+
+### Runner ###
+
+def run(file_names, load, assess_paper):
+    """
+    Runs load -> assess over the papers with bounded queues in between.
+    Input: list of file names (assessment order), load(file_name) -> dict,
+           assess_paper(i, file_name, **loaded) -> result.
+    Output: list of results, in the order of file_names.
+    """
+    workers = max(1, assess.assessment_workers)
+    loaded_queue = queue.Queue(maxsize=max(1, assess.prefetch_depth))
+    results = [None] * len(file_names)
+    stop = threading.Event()  # set on Ctrl+C, no thread blocks on a queue after that.
+
+    def put(item):
+        # Blocks while the queue is full (back-pressure), until the run is stopped.
+        while not stop.is_set():
+            try:
+                loaded_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def loader():
+        try:
+            for i, file_name in enumerate(file_names):
+                if stop.is_set():
+                    break
+                try:
+                    loaded = load(file_name)
+                except Exception as e:
+                    loaded = e
+                if not put((i, file_name, loaded)):
+                    break
+        finally:
+            for _ in range(workers):
+                if not put(_DONE):
+                    break
+
+    def worker():
+        while not stop.is_set():
+            try:
+                item = loaded_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                break
+            i, file_name, loaded = item
+            try:
+                if isinstance(loaded, Exception):
+                    raise loaded
+                results[i] = assess_paper(i, file_name, **loaded)
+            except Exception as e:
+                results[i] = e
+                assess.print_and_log(f"Error loading or processing {file_name}: {e}")
+            finally:
+                assess.clear_log_context()
+
+    threads = [threading.Thread(target=loader, name="loader", daemon=True)]
+    threads += [threading.Thread(target=worker, name=f"assessment-{n + 1}", daemon=True) for n in range(workers)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)  # short joins, so Ctrl+C still reaches the main thread.
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+    return results
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import hashlib
+from RoBAssessment import Assessment as assess
+"""
+Token-reducing preprocessing of plain text (Markdown) papers.
+Normalises whitespace, strips sections irrelevant to risk-of-bias judgments (references,
+acknowledgements, ...), repeated headers/footers and image placeholders, and collapses large tables.
+Results are cached by content hash, so each paper is preprocessed once.
+"""
+
+_image_patterns = [
+    re.compile(r"!\[[^\]]*\]\([^)]*\)"),  # ![alt](src)
+    re.compile(r"<img\b[^>]*>", re.IGNORECASE),
+    re.compile(r"<!--\s*image\s*-->", re.IGNORECASE),
+]
+_markdown_heading = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+### Steps ###
+
+def normalize_whitespace(text):
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\u00a0", " ")
+    text = re.sub(r"[ \t]+\n", "\n", text)  # trailing spaces.
+    text = re.sub(r"[ \t]{2,}", " ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)  # at most one blank line.
+    return text.strip() + "\n"
+
+def remove_images(text):
+    for pattern in _image_patterns:
+        text = pattern.sub("", text)
+    return text
+
+def _heading(line):
+    """
+    (level, title) of a Markdown heading line, or None.
+    """
+    match = _markdown_heading.match(line)
+    if match:
+        return len(match.group(1)), match.group(2)
+    return None
+
+def strip_sections(text, section_names):
+    """
+    Removes the sections whose Markdown heading matches one of section_names, up to the next heading
+    of the same or a higher level. Bold or plain text lines are not headings, so they never start or end a section.
+    """
+    names = re.compile(r"^(?:[\dIVX]+[.)]?\s*)?(?:" + "|".join(re.escape(n) for n in section_names) + r")\b",
+                       re.IGNORECASE)
+    kept = []
+    stripping_level = None
+    for line in text.split("\n"):
+        heading = _heading(line)
+        if heading is not None:
+            level, title = heading
+            if stripping_level is not None and level <= stripping_level:
+                stripping_level = None
+            if stripping_level is None and names.match(title.strip("*_ ").strip()):
+                stripping_level = level
+                continue
+        if stripping_level is None:
+            kept.append(line)
+    return "\n".join(kept)
+
+_fence = re.compile(r"^(```|~~~|\$\$)")
+_list_item = re.compile(r"^([-*+]|\d+[.)])(\s|$)")
+
+def _repeatable(line, max_length):
+    """
+    Lines that may be running headers / footers: short text lines, not Markdown structure (tables,
+    headings, list items) or delimiters without text (`$$`, `---`, fences).
+    """
+    return (line and len(line) <= max_length and re.search(r"[A-Za-z0-9]", line) is not None
+            and not line.startswith(("|", "#")) and not _list_item.match(line) and not _fence.match(line))
+
+def remove_repeated_lines(text, min_repeats, max_length=120, min_spacing=10):
+    """
+    Removes short lines that repeat at least min_repeats times, on average at least min_spacing lines
+    apart (running headers / footers, page numbers).
+    Markup and delimiter lines, and lines inside code fences or $$ display math, are kept.
+    """
+    lines = text.split("\n")
+    candidates = []
+    block = None  # opening delimiter of the current code / math block.
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        fence = _fence.match(stripped)
+        if block is not None:
+            if fence and fence.group(1) == block:
+                block = None
+            continue
+        if fence:
+            # a one-line $$ ... $$ equation opens no block.
+            if not (fence.group(1) == "$$" and len(stripped) > 2 and stripped.endswith("$$")):
+                block = fence.group(1)
+            continue
+        if _repeatable(stripped, max_length):
+            candidates.append(index)
+    positions = {}
+    for i in candidates:
+        positions.setdefault(lines[i].strip(), []).append(i)
+    repeated = set()
+    for occurrences in positions.values():
+        if (len(occurrences) >= min_repeats
+                and (occurrences[-1] - occurrences[0]) / (len(occurrences) - 1) >= min_spacing):
+            repeated.update(occurrences)
+    return "\n".join(line for i, line in enumerate(lines) if i not in repeated)
+
+def collapse_tables(text, max_rows):
+    """
+    Keeps the header and the first max_rows rows of Markdown tables, replacing the rest by a note.
+    """
+    output = []
+    table = []
+
+    def flush():
+        # header + separator + max_rows rows
+        if len(table) > max_rows + 2:
+            output.extend(table[:max_rows + 2])
+            output.append(f"[Table truncated: {len(table) - max_rows - 2} more rows omitted.]")
+        else:
+            output.extend(table)
+        table.clear()
+
+    for line in text.split("\n"):
+        if line.lstrip().startswith("|"):
+            table.append(line)
+        else:
+            flush()
+            output.append(line)
+    flush()
+    return "\n".join(output)
+
+### Pipeline ###
+
+def options():
+    return {
+        "strip_sections": assess.preprocess_strip_sections,
+        "repeated_line_min": assess.preprocess_repeated_line_min,
+        "max_table_rows": assess.preprocess_max_table_rows,
+    }
+
+def preprocess_text(text):
+    text = normalize_whitespace(text)
+    text = remove_images(text)
+    if assess.preprocess_strip_sections:
+        text = strip_sections(text, assess.preprocess_strip_sections)
+    if assess.preprocess_repeated_line_min:
+        text = remove_repeated_lines(text, assess.preprocess_repeated_line_min)
+    if assess.preprocess_max_table_rows:
+        text = collapse_tables(text, assess.preprocess_max_table_rows)
+    return normalize_whitespace(text)
+
+def preprocess(document, sha256, file_name=""):
+    """
+    Preprocesses a document, using the cache when the same content was preprocessed with the same options.
+    Input: document (string), sha256 of the document, file name (for the log).
+    Output: (preprocessed document, tokens before, tokens after).
+    """
+    key = hashlib.sha256((sha256 + json.dumps(options(), sort_keys=True)).encode("utf-8")).hexdigest()
+    cache_path = os.path.join(assess.preprocess_cache_folder, key + ".json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        document, before, after = cached["document"], cached["tokens_before"], cached["tokens_after"]
+    else:
+        before = len(assess.enc.encode(document))
+        document = preprocess_text(document)
+        after = len(assess.enc.encode(document))
+        os.makedirs(assess.preprocess_cache_folder, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"document": document, "tokens_before": before, "tokens_after": after}, f)
+
+    saved = (before - after) * 100 / before if before else 0
+    assess.print_and_log(f"Preprocessed {file_name}: {before} -> {after} tokens (-{saved:.0f}%).")
+    return document, before, after
@@ -0,0 +1,208 @@
+import sys
+import time
+import threading
+from collections import deque
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Transport
+"""
+Live progress display for assessment runs.
+Tracks completed / in-flight / failed requests, rolling tokens per minute, rolling latency and ETA.
+On a terminal the status line is redrawn in place; otherwise it is logged periodically.
+"""
+
+class RunProgress:
+    """
+    Counters of one assessment run. All methods are thread safe.
+    """
+    def __init__(self, label, total_requests):
+        self.label = label
+        self.total = total_requests
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.tokens = 0
+        self.start_time = time.monotonic()
+        self.token_events = deque()  # (timestamp, tokens) inside the rolling window.
+        self.latencies = deque(maxlen=assess.progress_latency_window)
+        self.decision_latencies = deque(maxlen=assess.progress_latency_window)  # streaming mode.
+        self.lock = threading.Lock()
+
+    def request_started(self):
+        with self.lock:
+            self.in_flight += 1
+        return time.monotonic()
+
+    def request_finished(self, started, tokens, requests=1):
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            self.completed += requests
+            self.tokens += tokens
+            self.token_events.append((now, tokens))
+            self.latencies.append(now - started)
+
+    def request_decided(self, started):
+        now = time.monotonic()
+        with self.lock:
+            self.decision_latencies.append(now - started)
+
+    def request_failed(self, started, requests=1):
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            self.failed += requests
+            self.latencies.append(now - started)
+
+    def snapshot(self):
+        """
+        Returns a dictionary of the current counters and rolling metrics.
+        """
+        now = time.monotonic()
+        with self.lock:
+            while self.token_events and now - self.token_events[0][0] > 60:
+                self.token_events.popleft()
+            window = min(60.0, max(now - self.start_time, 10.0))  # avoid extrapolating the first seconds.
+            tokens_per_minute = sum(t for _, t in self.token_events) * 60.0 / window
+            latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+            decision_latency = (sum(self.decision_latencies) / len(self.decision_latencies)
+                                if self.decision_latencies else None)
+            done = self.completed + self.failed
+            elapsed = now - self.start_time
+            eta = elapsed / done * max(0, self.total - done) if done else None
+            return {
+                "completed": self.completed,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "total": self.total,
+                "tokens": self.tokens,
+                "tokens_per_minute": tokens_per_minute,
+                "latency": latency,
+                "decision_latency": decision_latency,
+                "elapsed": elapsed,
+                "eta": eta,
+            }
+
+    def status_line(self):
+        s = self.snapshot()
+        budget = f"/{assess.tpm_budget}" if assess.tpm_budget else ""
+        eta = _format_seconds(s["eta"]) if s["eta"] is not None else "--:--"
+        decision = f" (decision {s['decision_latency']:.1f}s)" if s["decision_latency"] is not None else ""
+        queue = f" | queue wait {assess.scheduler.recent_wait():.1f}s" if assess.scheduler.enabled else ""
+        return (f"[{self.label}] {s['completed']}/{s['total']} requests done, {s['in_flight']} in-flight, "
+                f"{s['failed']} failed | {s['tokens_per_minute']:.0f}{budget} tok/min | "
+                f"latency {s['latency']:.1f}s{decision}{queue} | elapsed {_format_seconds(s['elapsed'])} | ETA {eta}")
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+### Run state ###
+current = None
+_stop = threading.Event()
+_thread = None
+# Serialises the status line and the console log handler, so their output never interleaves.
+console_lock = threading.RLock()
+_drawn = False  # a status line is on the screen.
+
+def is_tty():
+    return sys.stdout.isatty()
+
+def requests_per_item(streaming=False):
+    """
+    API requests of one assessment item: the assessment call, plus the parser call in Robust Mode
+    (the streaming mode replaces the parser call).
+    """
+    return 1 if streaming or assess.robust_mode != True else 2
+
+def start_run(label, total_requests):
+    """
+    Starts tracking a run and the display thread.
+    Input: run label (string), number of planned API requests (including parser calls).
+    """
+    global current, _thread
+    current = RunProgress(label, total_requests)
+    Transport.metrics.reset()
+    assess.hedger.reset()
+    assess.scheduler.start_job(label, total_requests)
+    if not assess.progress_display:
+        return current
+    _stop.clear()
+    _thread = threading.Thread(target=_display_loop, daemon=True)
+    _thread.start()
+    return current
+
+def end_run():
+    """
+    Stops the display thread and logs the final status.
+    """
+    global current, _thread
+    if current is None:
+        return
+    if _thread is not None:
+        _stop.set()
+        _thread.join()
+        clear_line()
+        _thread = None
+    run, current = current, None
+    assess.print_and_log("Run finished: " + run.status_line())
+    assess.print_and_log(Transport.metrics.summary())
+    assess.print_and_log(assess.dispatcher.summary())
+    if assess.hedger.enabled:
+        assess.print_and_log(assess.hedger.summary())
+    if assess.scheduler.enabled:
+        assess.print_and_log(assess.scheduler.summary())
+        assess.scheduler.end_job()
+
+def request_started():
+    return current.request_started() if current else time.monotonic()
+
+def request_finished(started, tokens, requests=1):
+    if current:
+        current.request_finished(started, tokens, requests)
+
+def request_decided(started):
+    if current:
+        current.request_decided(started)
+
+def request_failed(started, requests=1):
+    if current:
+        current.request_failed(started, requests)
+
+### Display ###
+
+def clear_line():
+    """
+    Clears the live status line, so other console output doesn't interleave with it.
+    """
+    global _drawn
+    with console_lock:
+        if _drawn:
+            sys.stdout.write("\r\033[K")
+            sys.stdout.flush()
+            _drawn = False
+
+def redraw():
+    global _drawn
+    run = current
+    if _thread is None or not is_tty() or run is None:
+        return
+    line = run.status_line()
+    with console_lock:
+        sys.stdout.write("\r\033[K" + line)
+        sys.stdout.flush()
+        _drawn = True
+
+def _display_loop():
+    if is_tty():
+        while not _stop.wait(assess.progress_refresh_interval):
+            redraw()
+    else:
+        # Not a terminal: plain periodic log lines.
+        while not _stop.wait(assess.progress_log_interval):
+            run = current
+            if run is not None:
+                assess.print_and_log(run.status_line())
@@ -0,0 +1,487 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import threading
+import contextlib
+import yaml
+"""
+Fair-share scheduling of API calls across concurrent assessment processes.
+Every process (job) submits its calls through a shared state file guarded by a lock file. Queued calls
+are admitted in queue order for as long as the account-wide TPM / RPM budget has room for them.
+The queue is ordered by priority (small interactive runs first) and then by weighted fair queuing
+(start-time fair queuing on estimated tokens), so a large job can't starve the others.
+Run `python -m RoBAssessment.Scheduler [--watch]` to inspect queue depth, per-job share and wait times.
+"""
+
+logger = logging.getLogger("logger")
+
+INTERACTIVE, BATCH = 0, 1
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)  # LK_LOCK gives up after 10 seconds.
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _alive(pid):
+        return True  # no cheap check, stale jobs are found by their heartbeat.
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+def empty_state():
+    return {"virtual_time": 0.0, "budget": {"tpm": 0, "rpm": 0}, "jobs": {}, "queue": [], "in_flight": {}, "usage": [],
+            "admissions": []}
+
+class SharedState:
+    """
+    JSON state file shared by all processes, read and written under an exclusive lock file.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, "state.json")
+        self.lock_path = os.path.join(folder, "state.lock")
+        self.thread_lock = threading.Lock()  # file locks don't serialise the threads of one process everywhere.
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Yields the state dictionary; changes are written back when the block exits without an error.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with self.thread_lock, open(self.lock_path, "a+") as lock_file:
+            _lock(lock_file)
+            try:
+                raw, state = self._read()
+                yield state
+                updated = json.dumps(state)
+                if updated != raw:  # unchanged state is not rewritten.
+                    temporary = f"{self.path}.{os.getpid()}.tmp"
+                    with open(temporary, "w", encoding="utf-8") as f:
+                        f.write(updated)
+                    os.replace(temporary, self.path)
+            finally:
+                _unlock(lock_file)
+
+    def _read(self):
+        """
+        Output: (file content, state dictionary); an empty or unreadable file gives an empty state.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = f.read()
+            return raw, json.loads(raw)
+        except (FileNotFoundError, ValueError):
+            return "", empty_state()
+
+    def read(self):
+        return self._read()[1]
+
+class _Request:
+    """
+    A call of this process waiting for admission.
+    """
+    def __init__(self, estimate):
+        self.estimate = estimate
+        self.ticket = None  # id of its ticket in the shared queue.
+        self.wait = None  # seconds waited, set when admitted.
+
+class Scheduler:
+    def __init__(self, enabled=False, folder="cache/scheduler", tpm=0, rpm=0, weight=1.0,
+                 interactive_requests=50, output_estimate=1000, poll_interval=0.2, pace_window=0.0,
+                 heartbeat_interval=5.0, stale_after=60.0, in_flight_timeout=1800.0):
+        self.enabled = enabled
+        self.state = SharedState(folder)
+        self.tpm = tpm  # account-wide budgets, 0 = no budget.
+        self.rpm = rpm
+        self.weight = weight
+        self.interactive_requests = interactive_requests  # runs with at most this many requests are interactive.
+        self.output_estimate = output_estimate  # output tokens assumed when max_output_tokens is not set.
+        self.poll_interval = poll_interval
+        self.pace_window = pace_window  # seconds, 0 = off; at most this share of the minute budget is admitted per window.
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after  # seconds without heartbeat before a job is dropped.
+        self.in_flight_timeout = in_flight_timeout  # seconds before an unfinished request is dropped.
+        self.job_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.label = "idle"
+        self.priority = BATCH
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()  # guards waiting; notified after every admission pass.
+        self.pass_lock = threading.Lock()
+        self.waiting = set()  # _Request objects of this process not admitted yet.
+        self.heartbeat_thread = None
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the statistics of this process for a new run.
+        """
+        with self.lock:
+            self.requests = 0
+            self.tokens = 0
+            self.waits = []
+
+    ### Jobs ###
+
+    def start_job(self, label, total_requests):
+        """
+        Registers the run of this process as a job, interactive when it is small.
+        """
+        self.reset()
+        if not self.enabled:
+            return
+        self.label = label
+        self.priority = INTERACTIVE if total_requests <= self.interactive_requests else BATCH
+        with self.state.transaction() as state:
+            self._register(state)
+        self._start_heartbeat()
+        kind = "interactive" if self.priority == INTERACTIVE else "batch"
+        logger.info(f"Scheduler: job {self.job_id} ({label}) registered as {kind}, weight {self.weight}.")
+
+    def end_job(self):
+        if not self.enabled:
+            return
+        with self.state.transaction() as state:
+            state["jobs"].pop(self.job_id, None)
+            state["queue"] = [t for t in state["queue"] if t["job"] != self.job_id]
+        self.label = "idle"
+        self.priority = BATCH
+
+    def _register(self, state):
+        state["budget"] = {"tpm": self.tpm, "rpm": self.rpm}
+        job = state["jobs"].setdefault(self.job_id, {
+            "pid": os.getpid(), "last_finish": 0.0, "requests": 0, "tokens": 0,
+            "wait_total": 0.0, "wait_max": 0.0,
+        })
+        job.update({"label": self.label, "weight": self.weight, "priority": self.priority, "heartbeat": time.time()})
+        return job
+
+    def _start_heartbeat(self):
+        if self.heartbeat_thread is not None:
+            return
+
+        def beat():
+            while True:
+                time.sleep(self.heartbeat_interval)
+                try:
+                    with self.state.transaction() as state:
+                        if self.job_id in state["jobs"]:
+                            state["jobs"][self.job_id]["heartbeat"] = time.time()
+                except OSError as e:
+                    logger.warning(f"Scheduler heartbeat failed: {e}")
+
+        self.heartbeat_thread = threading.Thread(target=beat, name="scheduler-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+
+    def _prune(self, state, now):
+        """
+        Drops jobs of finished processes, their tickets, and usage older than a minute.
+        """
+        stale = [job_id for job_id, job in state["jobs"].items()
+                 if now - job["heartbeat"] > self.stale_after or not _alive(job["pid"])]
+        for job_id in stale:
+            del state["jobs"][job_id]
+        state["queue"] = [t for t in state["queue"] if t["job"] in state["jobs"]]
+        state["in_flight"] = {ticket_id: t for ticket_id, t in state["in_flight"].items()
+                              if t["job"] in state["jobs"] and now - t["admitted"] < self.in_flight_timeout}
+        state["usage"] = [u for u in state["usage"] if now - u[0] <= 60]
+        state["admissions"] = [a for a in state.get("admissions", []) if now - a[0] <= self.pace_window]
+
+    ### Admission ###
+
+    def estimate(self, kwargs):
+        """
+        Estimated tokens of a request: about 4 characters per input token, plus the output allowance.
+        Requests on uploaded files use the average tokens per request of this job, when known.
+        """
+        text = json.dumps(kwargs.get("input"), ensure_ascii=False, default=str) + (kwargs.get("instructions") or "")
+        estimate = len(text) // 4 + (kwargs.get("max_output_tokens") or self.output_estimate)
+        with self.lock:
+            if self.requests:
+                estimate = max(estimate, self.tokens // self.requests)
+        return estimate
+
+    def _enqueue(self, state, estimate, now):
+        job = self._register(state)
+        start = max(state["virtual_time"], job["last_finish"])
+        finish = start + estimate / max(job["weight"], 1e-6)
+        job["last_finish"] = finish
+        ticket = {"id": uuid.uuid4().hex, "job": self.job_id, "priority": job["priority"],
+                  "start": start, "finish": finish, "tokens": estimate, "enqueued": now}
+        state["queue"].append(ticket)
+        return ticket["id"]
+
+    def _admit(self, state, now):
+        """
+        Admits queued tickets in (priority, finish) order while they fit the budget. Stops at the first
+        ticket that doesn't fit, so larger requests aren't overtaken indefinitely.
+        With a pace_window, admissions are paced (pace_window / 60 of the budget per pace window), so the budget
+        freed at the end of a minute is shared in fair-queuing order instead of going to whoever asks first.
+        """
+        tokens = sum(u[1] for u in state["usage"]) + sum(t["tokens"] for t in state["in_flight"].values())
+        requests = len(state["usage"]) + len(state["in_flight"])
+        pace = self.pace_window / 60.0 if self.tpm or self.rpm else 0  # pacing only applies to a budget.
+        paced_tokens = sum(a[1] for a in state["admissions"])
+        paced_requests = len(state["admissions"])
+        admitted = []
+        for ticket in sorted(state["queue"], key=lambda t: (t["priority"], t["finish"], t["enqueued"])):
+            if self.tpm and tokens + ticket["tokens"] > self.tpm and (tokens or requests):
+                break  # an oversized request alone is still admitted.
+            if self.rpm and requests + 1 > self.rpm:
+                break
+            if pace and paced_requests:
+                if self.tpm and paced_tokens + ticket["tokens"] > self.tpm * pace:
+                    break
+                if self.rpm and paced_requests + 1 > self.rpm * pace:
+                    break
+            tokens += ticket["tokens"]
+            requests += 1
+            if pace:
+                paced_tokens += ticket["tokens"]
+                paced_requests += 1
+                state["admissions"].append([now, ticket["tokens"], ticket["id"]])
+            state["virtual_time"] = max(state["virtual_time"], ticket["start"])
+            ticket["admitted"] = now
+            state["in_flight"][ticket["id"]] = ticket
+            admitted.append(ticket["id"])
+            job = state["jobs"].get(ticket["job"])
+            if job is not None:
+                wait = now - ticket["enqueued"]
+                job["wait_total"] += wait
+                job["wait_max"] = max(job["wait_max"], wait)
+        if admitted:
+            admitted_ids = set(admitted)
+            state["queue"] = [t for t in state["queue"] if t["id"] not in admitted_ids]
+
+    def _update(self, state, now):
+        """
+        Queues the waiting requests of this process that have no ticket (new, or dropped from the queue),
+        runs the admission and hands admitted tickets to their waiting threads.
+        """
+        queued = {t["id"] for t in state["queue"]}
+        with self.condition:
+            waiting = list(self.waiting)
+        for request in waiting:
+            if request.ticket not in queued and request.ticket not in state["in_flight"]:
+                request.ticket = self._enqueue(state, request.estimate, now)
+        self._admit(state, now)
+        with self.condition:
+            for request in waiting:
+                ticket = state["in_flight"].get(request.ticket)
+                if ticket is not None and request in self.waiting:
+                    self.waiting.discard(request)
+                    request.wait = ticket["admitted"] - ticket["enqueued"]
+            self.condition.notify_all()
+
+    def _admission_pass(self):
+        """
+        Runs admission passes until every waiting request of this process is queued. Only one thread
+        of the process runs a pass at a time; the others wait for its notification.
+        """
+        if not self.pass_lock.acquire(blocking=False):
+            return
+        try:
+            while True:
+                with self.state.transaction() as state:
+                    now = time.time()
+                    self._prune(state, now)
+                    self._update(state, now)
+                with self.condition:
+                    if all(request.ticket is not None for request in self.waiting):
+                        return
+        finally:
+            self.pass_lock.release()
+
+    def submit(self, kwargs):
+        """
+        Waits until the request may be sent. Output: ticket to pass to complete (None when disabled).
+        """
+        if not self.enabled:
+            return None
+        request = _Request(self.estimate(kwargs))
+        with self.condition:
+            self.waiting.add(request)
+        while True:
+            self._admission_pass()
+            with self.condition:
+                if request.wait is None:
+                    self.condition.wait(self.poll_interval)  # woken by passes / completions of this process.
+                if request.wait is not None:
+                    break
+        self._record_wait(request.wait)
+        return request.ticket
+
+    async def async_submit(self, kwargs):
+        """
+        Async counterpart of submit. The admission passes (file-locked transactions) run on the default
+        executor, so they don't block the event loop.
+        """
+        if not self.enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        request = _Request(self.estimate(kwargs))
+        with self.condition:
+            self.waiting.add(request)
+        try:
+            while True:
+                await loop.run_in_executor(None, self._admission_pass)
+                if request.wait is not None:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        except asyncio.CancelledError:
+            with self.condition:
+                self.waiting.discard(request)
+            if request.ticket is not None:  # queued, or admitted but never sent.
+                await loop.run_in_executor(None, self.withdraw, request.ticket)
+            raise
+        self._record_wait(request.wait)
+        return request.ticket
+
+    def withdraw(self, ticket_id):
+        """
+        Removes the ticket of a call cancelled before it was sent, queued or already admitted. An admitted
+        ticket releases its reservation without being charged, and the freed budget is admitted to others.
+        """
+        now = time.time()
+        with self.state.transaction() as state:
+            state["queue"] = [t for t in state["queue"] if t["id"] != ticket_id]
+            if state["in_flight"].pop(ticket_id, None) is not None:
+                state["admissions"] = [a for a in state["admissions"] if a[2] != ticket_id]
+                if state["queue"]:
+                    self._update(state, now)
+
+    def _record_wait(self, wait):
+        with self.lock:
+            self.waits.append(wait)
+
+    def complete(self, ticket_id, tokens=0):
+        """
+        Replaces the reservation of the ticket by the tokens actually used, and admits the tickets
+        that fit the freed budget.
+        tokens=None (usage not measured) keeps the reservation and leaves the average per request unchanged.
+        """
+        if ticket_id is None:
+            return
+        now = time.time()
+        with self.state.transaction() as state:
+            ticket = state["in_flight"].pop(ticket_id, None)
+            used = tokens if tokens is not None else (ticket["tokens"] if ticket else 0)
+            state["usage"].append([now, used, self.job_id])
+            for admission in state["admissions"]:
+                if admission[2] == ticket_id:
+                    admission[1] = used  # pace on the actual usage from now on.
+            job = state["jobs"].get(self.job_id)
+            if job is not None:
+                job["requests"] += 1
+                job["tokens"] += used
+                job["heartbeat"] = now
+            if state["queue"]:
+                self._update(state, now)
+        if tokens is not None:
+            with self.lock:
+                self.requests += 1
+                self.tokens += tokens
+
+    ### Inspection ###
+
+    def recent_wait(self, count=20):
+        """
+        Mean wait of the last `count` admitted requests of this process.
+        """
+        with self.lock:
+            waits = self.waits[-count:]
+            return sum(waits) / len(waits) if waits else 0.0
+
+    def summary(self):
+        with self.lock:
+            if not self.enabled:
+                return "Scheduler: disabled."
+            waited = [w for w in self.waits if w > 0.05]
+            mean = sum(self.waits) / len(self.waits) if self.waits else 0.0
+            longest = max(self.waits) if self.waits else 0.0
+            return (f"Scheduler: {len(self.waits)} requests admitted, {len(waited)} waited for their share "
+                    f"(mean wait {mean:.1f}s, max {longest:.1f}s).")
+
+def status(state):
+    """
+    Human readable status of a state dictionary: budget use, queue depth and per job share and waits.
+    """
+    now = time.time()
+    usage = [u for u in state["usage"] if now - u[0] <= 60]
+    used_tokens = sum(u[1] for u in usage)
+    reserved = sum(t["tokens"] for t in state["in_flight"].values())
+    budget = state["budget"]
+    lines = [
+        f"Budget: {used_tokens} used + {reserved} reserved / {budget['tpm'] or 'unlimited'} tokens per minute, "
+        f"{len(usage) + len(state['in_flight'])} / {budget['rpm'] or 'unlimited'} requests per minute.",
+        f"Queue depth: {len(state['queue'])}, in flight: {len(state['in_flight'])}, jobs: {len(state['jobs'])}.",
+    ]
+    for job_id, job in state["jobs"].items():
+        job_tokens = sum(u[1] for u in usage if u[2] == job_id)
+        queued = [t for t in state["queue"] if t["job"] == job_id]
+        oldest = max((now - t["enqueued"] for t in queued), default=0.0)
+        in_flight = sum(1 for t in state["in_flight"].values() if t["job"] == job_id)
+        mean_wait = job["wait_total"] / max(1, job["requests"] + in_flight)
+        kind = "interactive" if job["priority"] == INTERACTIVE else "batch"
+        lines.append(
+            f"  {job_id} [{job['label']}] {kind}, weight {job['weight']}: "
+            f"share {job_tokens * 100 / max(1, used_tokens):.0f}% of last-minute tokens, "
+            f"{len(queued)} queued (oldest {oldest:.1f}s), {in_flight} in flight, {job['requests']} done, "
+            f"wait mean {mean_wait:.1f}s / max {job['wait_max']:.1f}s")
+    return "\n".join(lines)
+
+def configured_folder(config_path="config.yaml"):
+    """
+    scheduler_folder of the config.yaml in the working directory, or the default folder.
+    """
+    try:
+        with open(config_path, "r") as config_file:
+            config = yaml.safe_load(config_file) or {}
+    except (OSError, yaml.YAMLError):
+        config = {}
+    return config.get("scheduler_folder", "cache/scheduler")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the state of the shared assessment scheduler.")
+    parser.add_argument("--folder", default=configured_folder(),
+                        help="state folder, default: scheduler_folder of config.yaml")
+    parser.add_argument("--watch", type=float, nargs="?", const=2.0, help="refresh every N seconds")
+    args = parser.parse_args()
+    shared = SharedState(args.folder)
+    while True:
+        text = status(shared.read())
+        if args.watch is None:
+            print(text)
+            break
+        sys.stdout.write("\033[2J\033[H" + time.strftime("%H:%M:%S") + "\n" + text + "\n")
+        sys.stdout.flush()
+        time.sleep(args.watch)
@@ -0,0 +1,235 @@
+import time
+import socket
+import threading
+import itertools
+import importlib.util
+import concurrent.futures
+import httpx
+import httpcore
+"""
+Shared HTTP transport for the OpenAI clients.
+Connection pool sized to the configured concurrency, keep-alive, HTTP/2 when the h2 package
+is installed, per-call timeout profiles and connection reuse / pool wait metrics.
+"""
+
+http2_available = importlib.util.find_spec("h2") is not None
+
+class TransportMetrics:
+    """
+    Counts requests, new vs reused connections and time spent waiting for a pooled connection.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.new_connections = 0
+            self.pool_wait_total = 0.0
+            self.pool_wait_max = 0.0
+
+    def record(self, new_connection, pool_wait):
+        with self.lock:
+            self.requests += 1
+            self.new_connections += 1 if new_connection else 0
+            self.pool_wait_total += pool_wait
+            self.pool_wait_max = max(self.pool_wait_max, pool_wait)
+
+    def summary(self):
+        with self.lock:
+            if not self.requests:
+                return "Transport: no requests."
+            reused = self.requests - self.new_connections
+            return (f"Transport: {self.requests} requests, {reused} on reused connections "
+                    f"({reused * 100 / self.requests:.0f}%), {self.new_connections} new connections, "
+                    f"pool wait avg {self.pool_wait_total / self.requests * 1000:.1f} ms, "
+                    f"max {self.pool_wait_max * 1000:.1f} ms.")
+
+metrics = TransportMetrics()
+
+class _RequestTrace:
+    """
+    httpcore "trace" extension callback. The pool wait ends when the request either opens
+    a new connection or starts sending on an existing one.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.acquired = None
+        self.new_connection = False
+
+    def __call__(self, event, info):
+        if self.acquired is None:
+            if event == "connection.connect_tcp.started":
+                self.new_connection = True
+                self.acquired = time.monotonic()
+            elif event.endswith("send_request_headers.started"):
+                self.acquired = time.monotonic()
+
+    def record(self):
+        metrics.record(self.new_connection, (self.acquired or time.monotonic()) - self.started)
+
+class _AsyncRequestTrace(_RequestTrace):
+    async def __call__(self, event, info):
+        _RequestTrace.__call__(self, event, info)
+
+### Abortable connections ###
+
+# Network stream used by each deadline call, so the call can be aborted when its deadline passes.
+_call = threading.local()
+_call_ids = itertools.count(1)
+_call_streams = {}  # {call id: _TrackedStream}
+_aborted_calls = set()  # calls past their deadline; a stream they still use is shut down.
+
+class _TrackedStream(httpcore.NetworkStream):
+    """
+    Network stream that registers itself as the stream of the deadline call running on the thread.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _track(self):
+        call_id = getattr(_call, "id", None)
+        if call_id is not None:
+            _call_streams[call_id] = self
+            if call_id in _aborted_calls:  # e.g. it was still waiting for a pooled connection.
+                self.abort()
+
+    def read(self, max_bytes, timeout=None):
+        self._track()
+        return self.stream.read(max_bytes, timeout)
+
+    def write(self, buffer, timeout=None):
+        self._track()
+        return self.stream.write(buffer, timeout)
+
+    def close(self):
+        self.stream.close()
+
+    def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        return _TrackedStream(self.stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info):
+        return self.stream.get_extra_info(info)
+
+    def abort(self):
+        """
+        Shuts the socket down, so the blocked request fails at once and the connection is discarded.
+        HTTP/2 connections are shared by other requests and are left to the read timeout.
+        """
+        ssl_object = self.get_extra_info("ssl_object")
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+            return
+        sock = self.get_extra_info("socket")
+        try:
+            if sock is not None:
+                sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed.
+
+class _TrackedBackend(httpcore.NetworkBackend):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        return _TrackedStream(self.backend.connect_tcp(host, port, timeout, local_address, socket_options))
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return _TrackedStream(self.backend.connect_unix_socket(path, timeout, socket_options))
+
+    def sleep(self, seconds):
+        self.backend.sleep(seconds)
+
+class MeteredTransport(httpx.HTTPTransport):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # httpx has no parameter for the network backend of its pool.
+        self._pool._network_backend = _TrackedBackend(self._pool._network_backend)
+
+    def handle_request(self, request):
+        trace = _RequestTrace()
+        request.extensions["trace"] = trace
+        try:
+            return super().handle_request(request)
+        finally:
+            trace.record()
+
+class AsyncMeteredTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        trace = _AsyncRequestTrace()
+        request.extensions["trace"] = trace
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            trace.record()
+
+### Builders ###
+
+def build_timeout(profile):
+    """
+    httpx.Timeout from a timeout profile {connect, read, write, pool} (seconds).
+    """
+    return httpx.Timeout(connect=profile.get("connect"), read=profile.get("read"),
+                         write=profile.get("write"), pool=profile.get("pool"))
+
+def build_limits(max_connections, keepalive_expiry):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                        keepalive_expiry=keepalive_expiry)
+
+def build_http_client(max_connections, keepalive_expiry, http2, timeout_profile):
+    limits = build_limits(max_connections, keepalive_expiry)
+    http2 = http2 and http2_available
+    return httpx.Client(transport=MeteredTransport(limits=limits, http2=http2),
+                        timeout=build_timeout(timeout_profile))
+
+def build_async_http_client(max_connections, keepalive_expiry, http2, timeout_profile):
+    limits = build_limits(max_connections, keepalive_expiry)
+    http2 = http2 and http2_available
+    return httpx.AsyncClient(transport=AsyncMeteredTransport(limits=limits, http2=http2),
+                             timeout=build_timeout(timeout_profile))
+
+### Total timeout ###
+
+class DeadlineExecutor:
+    """
+    Runs calls on a thread pool so they can be stopped after a total deadline.
+    max_workers should leave room for calls still stopping after their deadline (e.g. twice the connection pool).
+    """
+    def __init__(self, max_workers=32):
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def call(self, total, function, *args, **kwargs):
+        """
+        Runs function(*args, **kwargs) and raises TimeoutError if it doesn't return within `total` seconds.
+        On the deadline, the connection of the call (made by a MeteredTransport client) is shut down,
+        so the request is closed instead of running on in the background.
+        """
+        if not total:
+            return function(*args, **kwargs)
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                                      thread_name_prefix="api-call")
+        call_id = next(_call_ids)
+
+        def run():
+            _call.id = call_id
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _call.id = None
+                _call_streams.pop(call_id, None)
+                _aborted_calls.discard(call_id)
+
+        future = self.executor.submit(run)
+        try:
+            return future.result(timeout=total)
+        except concurrent.futures.TimeoutError:
+            if not future.cancel():
+                _aborted_calls.add(call_id)  # before the lookup: a stream tracked from now on aborts itself.
+                stream = _call_streams.get(call_id)
+                if stream is not None:
+                    stream.abort()
+            raise TimeoutError(f"API call exceeded the total timeout of {total} seconds.")
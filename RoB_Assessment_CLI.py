@@ -1,6 +1,7 @@
 from RoBAssessment import Assessment as assess
 from RoBAssessment import AllCriteria
 from RoBAssessment import PerCriteria
+from RoBAssessment import Benchmark
 
 def main_menu():
     while True:
@@ -9,6 +10,7 @@ def main_menu():
         print("Choose Assessment Mode:")
         print("[1] Assess Criteria one-by-one per Paper")
         print("[2] Assess All Criteria per Paper")
+        print("[3] Benchmark Assessment Modes against Reference")
         print("[q] Quit")
         choice = input("Select an option: ").strip()
 
@@ -16,6 +18,9 @@ def main_menu():
             per_criteria_mode()
         elif choice == "2":
             all_criteria_mode()
+        elif choice == "3":
+            print("\nStarting benchmark...")
+            Benchmark.run_benchmark()
         elif choice.lower() == "q":
             print("Exiting...")
             break
@@ -65,6 +70,7 @@ def all_criteria_pdf_input_menu():
         print("[2] Start assessment using Stored Files")
         print("[3] Get Number of All Stored Files")
         print("[4] Delete All Stored Files")
+        print("[5] Upload and Assess Local Files (assessment starts after the first upload)")
         print("[b] Previous Menu")
         choice = input("Select an option: ").strip()
 
@@ -83,6 +89,9 @@ def all_criteria_pdf_input_menu():
             assess.delete_all_stored_files()
             print(str(count_stored_files)+" files have been deleted.")
             print("All stored files has been deleted.")
+        elif choice == "5":
+            print("Uploading and assessing local files...")
+            AllCriteria.process_pdf_local()
         elif choice.lower() == "b":
             break
         else:
@@ -111,6 +120,7 @@ def per_criteria_pdf_input_menu():
         print("[2] Start assessment using Stored Files")
         print("[3] Get Number of All Stored Files")
         print("[4] Delete All Stored Files")
+        print("[5] Upload and Assess Local Files (assessment starts after the first upload)")
         print("[b] Previous Menu")
         choice = input("Select an option: ").strip()
 
@@ -129,6 +139,9 @@ def per_criteria_pdf_input_menu():
             assess.delete_all_stored_files()
             print(str(count_stored_files)+" files have been deleted.")
             print("All stored files has been deleted.")
+        elif choice == "5":
+            print("Uploading and assessing local files...")
+            PerCriteria.process_pdf_local()
         elif choice.lower() == "b":
             break
         else:
@@ -0,0 +1,16 @@
+import os
+import sys
+import shutil
+import tempfile
+"""
+RoBAssessment reads config.yaml and prompt.yaml from the working directory on import and creates its
+output / log folders there, so the tests run in a scratch copy of the repository configuration.
+"""
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository)
+
+workspace = tempfile.mkdtemp(prefix="rob_tests_")
+for name in ("config.yaml", "prompt.yaml"):
+    shutil.copy(os.path.join(repository, name), workspace)
+os.chdir(workspace)
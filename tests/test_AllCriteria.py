@@ -0,0 +1,39 @@
+import pytest
+import pydantic
+from RoBAssessment import Assessment as assess
+from RoBAssessment import AllCriteria
+from RoBAssessment import PerCriteria
+
+def decisions(value):
+    fields = {}
+    for sub_crit_dict in assess.nested_subs.values():
+        for sub_crit_id in sub_crit_dict:
+            name = AllCriteria.criteria_field_name(sub_crit_id)
+            fields[name] = value
+            fields[name + "_explanation"] = f"reason {sub_crit_id}"
+    return fields
+
+def test_field_names():
+    assert AllCriteria.criteria_field_name("1.1") == "criteria_1_1"
+    assert AllCriteria.criteria_field_name("6.2a") == "criteria_6_2a"
+
+def test_schema_has_one_decision_per_summary_column():
+    decision_fields = [f for f in AllCriteria.AssessmentResult.model_fields if not f.endswith("_explanation")]
+    assert len(decision_fields) == len(assess.summary_header) - 2 == assess.sub_criteria_count
+
+def test_summary_row_follows_the_header_order():
+    fields = decisions("no")
+    first = AllCriteria.criteria_field_name(next(iter(next(iter(assess.nested_subs.values())))))
+    fields[first] = "yes"
+    row = AllCriteria.summary_row(AllCriteria.AssessmentResult(**fields))
+    assert row == ["yes"] + ["no"] * (assess.sub_criteria_count - 1)
+
+def test_both_modes_accept_the_same_decisions():
+    for value in ("yes", "no"):
+        AllCriteria.AssessmentResult(**decisions(value))
+        PerCriteria.AssessmentResultPerCriteria(explanation="", result=value)
+        PerCriteria.AssessmentResultDecisionFirst(explanation="", result=value)
+    with pytest.raises(pydantic.ValidationError):
+        AllCriteria.AssessmentResult(**decisions("na"))
+    with pytest.raises(pydantic.ValidationError):
+        PerCriteria.AssessmentResultPerCriteria(explanation="", result="na")
@@ -0,0 +1,163 @@
+import json
+import types
+import asyncio
+import logging
+import threading
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Dispatcher
+
+def record(message="message", name="logger", level=logging.INFO):
+    record = logging.LogRecord(name, level, __file__, 1, message, None, None)
+    assess.ContextFilter().filter(record)
+    return record
+
+### Logging ###
+
+def test_log_context_is_attached_and_removed():
+    assess.set_log_context(paper="a.md", criterion="1.1")
+    assert record().context == {"paper": "a.md", "criterion": "1.1"}
+    assess.set_log_context(criterion=None)
+    assert record().context == {"paper": "a.md"}
+    assess.clear_log_context()
+    assert record().context == {}
+
+def test_json_records_carry_run_and_context():
+    assess.set_log_context(paper="a.md")
+    try:
+        entry = json.loads(assess.JsonFormatter().format(record("hello")))
+    finally:
+        assess.clear_log_context()
+    assert entry["message"] == "hello"
+    assert entry["paper"] == "a.md"
+    assert entry["run"] == assess.start_system_time
+
+def test_library_request_lines_are_not_logged():
+    for library in ("httpx", "openai"):
+        assert not logging.getLogger(library).isEnabledFor(logging.INFO)
+        assert logging.getLogger(library).isEnabledFor(logging.WARNING)
+
+### Calls ###
+
+class FakeResponses:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, timeout=None, **kwargs):
+        self.calls.append(kwargs)
+        return types.SimpleNamespace(id="resp-1", usage=types.SimpleNamespace(total_tokens=7, input_tokens=5))
+
+    parse = create
+
+def test_async_wrappers_route_through_the_dispatcher(monkeypatch):
+    responses = FakeResponses()
+    endpoint = Dispatcher.Endpoint("fake", None, types.SimpleNamespace(responses=responses))
+    monkeypatch.setattr(assess, "dispatcher", Dispatcher.Dispatcher([endpoint]))
+    assess.reset_request_stats()
+
+    response = asyncio.run(assess.async_create_response(model="m", input=[]))
+    asyncio.run(assess.async_parse_response(model="m", input=[], text_format=None))
+
+    assert response.usage.total_tokens == 7
+    assert [c["model"] for c in responses.calls] == ["m", "m"]
+    assert assess.get_request_count() == 2
+    assert endpoint.calls == 2 and endpoint.in_flight == 0
+
+def test_stored_files_are_pinned_by_file_id(monkeypatch):
+    def files(*stored):
+        listed = [types.SimpleNamespace(filename=name, id=file_id) for name, file_id in stored]
+        return types.SimpleNamespace(files=types.SimpleNamespace(list=lambda: listed))
+
+    a = Dispatcher.Endpoint("a", files(("x.pdf", "file-a")), None)
+    b = Dispatcher.Endpoint("b", files(("x.pdf", "file-b"), ("y.pdf", "file-c")), None)
+    dispatcher = Dispatcher.Dispatcher([a, b])
+    monkeypatch.setattr(assess, "dispatcher", dispatcher)
+
+    assert assess.get_file_name_id_dict() == {"x.pdf": "file-a", "y.pdf": "file-c"}
+    assert dispatcher.file_endpoints == {"file-a": "a", "file-b": "b", "file-c": "b"}
+
+### Streaming ###
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __iter__(self):
+        for delta in self.deltas:
+            yield types.SimpleNamespace(type="response.output_text.delta", delta=delta)
+
+    def get_final_response(self):
+        return "final"
+
+def stream_endpoint(deltas):
+    responses = types.SimpleNamespace(stream=lambda timeout=None, **kwargs: FakeStream(deltas))
+    return types.SimpleNamespace(client=types.SimpleNamespace(responses=responses))
+
+def test_in_log_context_carries_the_context_to_other_threads():
+    seen = []
+    assess.set_log_context(paper="a.md", criterion="1.1")
+    try:
+        wrapped = assess.in_log_context(lambda: seen.append(assess.get_log_context()))
+    finally:
+        assess.clear_log_context()
+    thread = threading.Thread(target=wrapped)
+    thread.start()
+    thread.join()
+    assert seen == [{"paper": "a.md", "criterion": "1.1"}]
+
+def test_stream_reports_the_decision_and_truncates_the_explanation(monkeypatch):
+    from RoBAssessment import PerCriteria
+    monkeypatch.setitem(assess.context_tokens, "file-1", 1000)
+    deltas = ['{"result": "yes", ', '"explanation": "', "one", " two", " three", " four", '"}']
+    decisions = []
+    kwargs = {"instructions": "", "text_format": PerCriteria.AssessmentResultDecisionFirst,
+              "input": [{"role": "user", "content": [{"type": "input_file", "file_id": "file-1"}]}]}
+
+    response = assess.consume_stream(stream_endpoint(deltas), "default", "result",
+                                     lambda decision, seconds: decisions.append(decision), 3, **kwargs)
+
+    assert decisions == ["yes"]
+    assert response.output_parsed.result == "yes"
+    assert response.output_parsed.explanation == "one two [explanation truncated]"
+    assert response.usage.estimated and response.usage.total_tokens > 1000  # includes the file context.
+
+def test_stream_without_limit_returns_the_final_response():
+    from RoBAssessment import PerCriteria
+    deltas = ['{"result": "no", "explanation": "fine"}']
+    response = assess.consume_stream(stream_endpoint(deltas), "default", "result", None, 0,
+                                     text_format=PerCriteria.AssessmentResultDecisionFirst)
+    assert response == "final"
+
+def test_context_tokens_are_learned_from_completed_calls(monkeypatch):
+    monkeypatch.setattr(assess, "context_tokens", {})
+    kwargs = {"instructions": "", "input": [{"role": "user", "content": [
+        {"type": "input_text", "text": "a b c"}, {"type": "input_file", "file_id": "file-9"}]}]}
+    usage = types.SimpleNamespace(total_tokens=600, input_tokens=503)
+    assess.learn_context_tokens(kwargs, types.SimpleNamespace(id="resp-1", usage=usage))
+    assert assess.context_tokens == {"file-9": 500}
+
+def test_decision_callback_runs_in_the_log_context_of_the_caller(monkeypatch):
+    from RoBAssessment import PerCriteria
+    endpoint = stream_endpoint(['{"result": "yes", "explanation": "x"}'])
+    seen = []
+
+    def call(function, kwargs, total=None, files=False):
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(response=function(endpoint, **kwargs)))
+        thread.start()  # like the deadline executor.
+        thread.join()
+        return result["response"], endpoint
+
+    monkeypatch.setattr(assess.dispatcher, "call", call)
+    assess.set_log_context(paper="a.md", criterion="1.1")
+    try:
+        assess.stream_response(on_decision=lambda decision, seconds: seen.append(assess.get_log_context()),
+                               text_format=PerCriteria.AssessmentResultDecisionFirst, input=[])
+    finally:
+        assess.clear_log_context()
+    assert seen == [{"paper": "a.md", "criterion": "1.1"}]
@@ -0,0 +1,85 @@
+import types
+import pytest
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Benchmark
+
+### Metrics ###
+
+def test_cohen_kappa():
+    assert Benchmark.cohen_kappa([], []) is None
+    assert Benchmark.cohen_kappa(["yes", "no"], ["yes", "no"]) == 1.0
+    assert Benchmark.cohen_kappa(["yes", "yes"], ["yes", "yes"]) == 1.0  # chance agreement of 1.
+    assert Benchmark.cohen_kappa(["yes", "no"], ["no", "yes"]) == -1.0
+    # observed 0.75, chance 0.5.
+    assert Benchmark.cohen_kappa(["yes", "yes", "no", "no"], ["yes", "no", "no", "no"]) == pytest.approx(0.5)
+
+def test_score_per_criterion_and_overall(monkeypatch):
+    monkeypatch.setattr(assess, "summary_header", ["No", "File", "c1", "c2"])
+    reference = {"a.md": {"c1": "yes", "c2": "no"}, "b.md": {"c1": "no", "c2": "no"}, "c.md": {"c1": "yes"}}
+    results = {"a.md": ["1", "a.md", "Yes", "no"], "b.md": ["2", "b.md", "yes"], "c.md": None}
+    scores = Benchmark.score(results, reference)
+    assert scores["c1"] == {"agreement": 0.5, "kappa": 0.0, "n": 2}
+    assert scores["c2"]["agreement"] == 0.5  # b.md has no c2 decision ("missing").
+    assert scores["overall"]["n"] == 4
+
+### Recordings ###
+
+def test_configuration_key_changes_with_the_settings(monkeypatch):
+    monkeypatch.setattr(assess, "preprocessing", False)
+    base = Benchmark.configuration_key({"mode": "per"})
+    assert base == Benchmark.configuration_key({"mode": "per"})
+    assert base != Benchmark.configuration_key({"mode": "all"})
+    assert base != Benchmark.configuration_key({"mode": "per", "model": "other-model"})
+    assert base != Benchmark.configuration_key({"mode": "per", "explanation_token_limit": 50})
+    monkeypatch.setattr(assess, "preprocessing", True)
+    assert base != Benchmark.configuration_key({"mode": "per"})
+
+### Runner ###
+
+@pytest.fixture
+def benchmark(monkeypatch, tmp_path):
+    monkeypatch.setattr(assess, "benchmark_recordings_folder", str(tmp_path))
+    monkeypatch.setattr(assess, "summary_header", ["No", "File", "c1"])
+    monkeypatch.setattr(assess, "sub_criteria_count", 1)
+    monkeypatch.setattr(Benchmark.Progress, "start_run", lambda label, total: None)
+    monkeypatch.setattr(Benchmark.Progress, "end_run", lambda: None)
+    seen = []
+
+    def run(file_names, load, assess_paper):
+        return [assess_paper(i, name, sha256=name) for i, name in enumerate(file_names)]
+
+    def assess_paper(i, file_name, pdfs_count, sha256=None, **loaded):
+        seen.append((assess.model_name, assess.enc))
+        assess.count_request({})
+        return "", "", [str(i + 1), file_name, "yes"], 10, 0
+
+    monkeypatch.setattr(Benchmark.Pipeline, "run", run)
+    monkeypatch.setattr(Benchmark.PerCriteria, "assess_paper", assess_paper)
+    return seen
+
+def test_run_configuration_reports_paper_and_wall_time(benchmark):
+    reference = {"a.md": {"c1": "yes"}}
+    first = Benchmark.run_configuration({"mode": "per"}, ["a.md"], reference)
+    replayed = Benchmark.run_configuration({"mode": "per"}, ["a.md"], reference)
+    assert "seconds" not in first and "seconds_basis" not in first
+    assert (first["recorded"], replayed["recorded"]) == (0, 1)
+    assert replayed["paper_seconds"] == first["paper_seconds"]  # recorded assessment time.
+    assert (first["agreement"], first["tokens"], first["requests"]) == (1.0, 10, 1)
+
+def test_model_override_rebuilds_and_restores_the_encoder(benchmark, monkeypatch):
+    encoders = {}
+    monkeypatch.setattr(Benchmark.tiktoken, "encoding_for_model",
+                        lambda model: encoders.setdefault(model, types.SimpleNamespace(model=model)))
+    enc, model = assess.enc, assess.model_name
+    Benchmark.run_configuration({"mode": "per", "model": "other-model"}, ["a.md"], {"a.md": {"c1": "yes"}})
+    assert benchmark == [("other-model", encoders["other-model"])]
+    assert (assess.enc, assess.model_name) == (enc, model)
+
+def test_unknown_model_keeps_the_encoder(benchmark, monkeypatch):
+    def unknown(model):
+        raise KeyError(model)
+
+    monkeypatch.setattr(Benchmark.tiktoken, "encoding_for_model", unknown)
+    enc = assess.enc
+    Benchmark.run_configuration({"mode": "per", "model": "local-model"}, ["a.md"], {"a.md": {"c1": "yes"}})
+    assert benchmark == [("local-model", enc)]
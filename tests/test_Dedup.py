@@ -0,0 +1,76 @@
+import pytest
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Dedup
+
+TEXT = " ".join(f"word{i}" for i in range(400))
+
+def fingerprint(text):
+    return {"sha256": Dedup.exact_hash(text), "minhash": Dedup.minhash(text)}
+
+@pytest.fixture(autouse=True)
+def deduplication(monkeypatch):
+    monkeypatch.setattr(assess, "deduplication", True)
+
+def summary(*file_names):
+    header = ["no", "file_name", "1.1) A", "1.2) B"]
+    return [header] + [[str(i + 1), name, "yes", "no"] for i, name in enumerate(file_names)]
+
+### Clustering ###
+
+def test_exact_duplicates_after_normalization():
+    clusters = Dedup.cluster_fingerprints({
+        "b.md": fingerprint(TEXT),
+        "a.md": fingerprint("  " + TEXT.upper() + "\n"),
+        "c.md": fingerprint("something else entirely " * 20),
+    })
+    assert clusters == {"a.md": ["b.md"], "c.md": []}
+
+def test_near_duplicates_are_clustered():
+    edited = TEXT.replace("word200", "changed")
+    clusters = Dedup.cluster_fingerprints({"a.md": fingerprint(TEXT), "b.md": fingerprint(edited)})
+    assert clusters == {"a.md": ["b.md"]}
+
+def test_different_documents_are_kept_apart():
+    other = " ".join(f"other{i}" for i in range(400))
+    clusters = Dedup.cluster_fingerprints({"a.md": fingerprint(TEXT), "b.md": fingerprint(other)})
+    assert clusters == {"a.md": [], "b.md": []}
+
+def test_files_without_signature_only_match_exactly():
+    clusters = Dedup.cluster_fingerprints({
+        "a.pdf": {"sha256": "x", "minhash": None},
+        "b.pdf": {"sha256": "x", "minhash": None},
+        "c.pdf": {"sha256": "y", "minhash": None},
+    })
+    assert clusters == {"a.pdf": ["b.pdf"], "c.pdf": []}
+
+### Fan out ###
+
+def test_fan_out_copies_rows_to_duplicates():
+    notes = []
+    result = Dedup.fan_out_duplicates(summary("a.md", "c.md"), notes, {"a.md": ["b.md"], "c.md": []})
+    assert result[0][-1] == "duplicate_of"
+    assert result[1:] == [
+        ["1", "a.md", "yes", "no", ""],
+        ["2", "b.md", "yes", "no", "a.md"],
+        ["3", "c.md", "yes", "no", ""],
+    ]
+    assert len(notes) == 1
+
+def test_fan_out_keeps_the_column_without_duplicates():
+    result = Dedup.fan_out_duplicates(summary("a.md"), [], {"a.md": []})
+    assert result[0][-1] == "duplicate_of"
+    assert result[1] == ["1", "a.md", "yes", "no", ""]
+
+def test_fan_out_emits_error_rows_for_duplicates_of_failed_papers():
+    notes = []
+    result = Dedup.fan_out_duplicates(summary("c.md"), notes, {"a.md": ["b.md"], "c.md": []})
+    assert result[1:] == [
+        ["1", "c.md", "yes", "no", ""],
+        ["2", "b.md", "error", "error", "a.md"],
+    ]
+    assert "failed" in notes[0]
+
+def test_fan_out_is_off_without_deduplication(monkeypatch):
+    monkeypatch.setattr(assess, "deduplication", False)
+    original = summary("a.md")
+    assert Dedup.fan_out_duplicates(original, [], {"a.md": []}) is original
@@ -0,0 +1,166 @@
+import types
+import asyncio
+import httpx
+import openai
+import pytest
+from RoBAssessment import Dispatcher
+
+def endpoint(name, **kwargs):
+    return Dispatcher.Endpoint(name, None, None, **kwargs)
+
+def response(tokens=10, id="resp-1"):
+    return types.SimpleNamespace(id=id, usage=types.SimpleNamespace(total_tokens=tokens))
+
+def rate_limit_error():
+    request = httpx.Request("POST", "http://test")
+    return openai.RateLimitError("429", response=httpx.Response(429, request=request), body=None)
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://test"))
+
+def file_request(file_id):
+    return {"model": "m", "input": [{"role": "user", "content": [{"type": "input_file", "file_id": file_id}]}]}
+
+### Routing ###
+
+def test_least_loaded_endpoint_is_used():
+    a, b = endpoint("a"), endpoint("b")
+    dispatcher = Dispatcher.Dispatcher([a, b])
+    a.in_flight = 2
+    result, used = dispatcher.call(lambda e, **kw: response(), {"model": "m"})
+    assert used is b
+    assert (b.in_flight, b.calls) == (0, 1)
+
+def test_fails_over_on_connection_errors():
+    a, b = endpoint("a"), endpoint("b")
+    dispatcher = Dispatcher.Dispatcher([a, b], backoff_min=30)
+
+    def call(e, **kw):
+        if e is a:
+            raise connection_error()
+        return response()
+
+    result, used = dispatcher.call(call, {"model": "m"})
+    assert used is b
+    assert a.failures == 1 and a.cooldown_until > 0
+
+def test_rate_limited_endpoint_backs_off():
+    a, b = endpoint("a"), endpoint("b")
+    dispatcher = Dispatcher.Dispatcher([a, b], backoff_min=30)
+    calls = []
+
+    def call(e, **kw):
+        calls.append(e.name)
+        if e is a:
+            raise rate_limit_error()
+        return response()
+
+    dispatcher.call(call, {"model": "m"})
+    dispatcher.call(call, {"model": "m"})
+    assert calls == ["a", "b", "b"]  # a is backed off after its 429.
+    assert a.rate_limited == 1
+
+def test_last_error_is_raised_when_every_endpoint_fails():
+    dispatcher = Dispatcher.Dispatcher([endpoint("a"), endpoint("b")], backoff_min=0)
+
+    def call(e, **kw):
+        raise connection_error()
+
+    with pytest.raises(openai.APIConnectionError):
+        dispatcher.call(call, {"model": "m"})
+
+def test_other_errors_are_not_failed_over():
+    a, b = endpoint("a"), endpoint("b")
+    dispatcher = Dispatcher.Dispatcher([a, b])
+
+    def call(e, **kw):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        dispatcher.call(call, {"model": "m"})
+    assert a.calls + b.calls == 1
+
+def test_over_budget_endpoint_waits():
+    a = endpoint("a", rpm=1)
+    dispatcher = Dispatcher.Dispatcher([a])
+    dispatcher.call(lambda e, **kw: response(), {"model": "m"})
+    assert a.wait_time(Dispatcher.time.monotonic()) > 50
+
+def test_model_map_and_file_endpoints():
+    local = endpoint("local", files=False, model_map={"m": "local-model"})
+    dispatcher = Dispatcher.Dispatcher([local])
+    seen = {}
+    dispatcher.call(lambda e, **kw: seen.update(kw) or response(), {"model": "m"})
+    assert seen["model"] == "local-model"
+    with pytest.raises(RuntimeError):  # no endpoint supports files.
+        dispatcher.call(lambda e, **kw: response(), {}, files=True)
+
+### Pinning ###
+
+def test_file_requests_stay_on_the_endpoint_holding_the_file():
+    a, b = endpoint("a"), endpoint("b")
+    dispatcher = Dispatcher.Dispatcher([a, b])
+    dispatcher.pin_file("file-1", b)
+    dispatcher.pin_file("file-2", a)
+    assert dispatcher.pinned_endpoint(file_request("file-1")) is b
+    assert dispatcher.pinned_endpoint(file_request("file-2")) is a
+    assert dispatcher.pinned_endpoint(file_request("file-3")) is None
+
+    def call(e, **kw):
+        raise connection_error()
+
+    with pytest.raises(openai.APIConnectionError):  # no failover away from the file.
+        dispatcher.call(call, file_request("file-1"))
+    assert (a.calls, b.calls) == (0, 1)
+
+def test_stored_responses_are_pinned():
+    a, b = endpoint("a"), endpoint("b")
+    dispatcher = Dispatcher.Dispatcher([a, b])
+    a.in_flight = 1
+    result, used = dispatcher.call(lambda e, **kw: response(id="resp-9"), {"model": "m", "store": True})
+    assert used is b
+    a.in_flight = 0
+    assert dispatcher.pinned_endpoint({"previous_response_id": "resp-9"}) is b
+
+### Async ###
+
+def test_async_call_releases_the_endpoint_when_cancelled():
+    a = endpoint("a")
+    dispatcher = Dispatcher.Dispatcher([a])
+
+    async def slow(e, **kw):
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.ensure_future(dispatcher.async_call(slow, {"model": "m"}))
+        await asyncio.sleep(0.05)
+        assert a.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert a.in_flight == 0
+
+def test_async_call_completes_tickets_off_the_event_loop():
+    threads = []
+
+    class Scheduler:
+        async def async_submit(self, kwargs):
+            return "ticket"
+
+        def complete(self, ticket, tokens=0):
+            threads.append((Dispatcher.threading.current_thread(), ticket, tokens))
+
+    dispatcher = Dispatcher.Dispatcher([endpoint("a")], scheduler=Scheduler())
+
+    async def call(e, **kw):
+        return response(tokens=7)
+
+    async def run():
+        await dispatcher.async_call(call, {"model": "m"})
+        return Dispatcher.threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert [(ticket, tokens) for _, ticket, tokens in threads] == [("ticket", 7)]
+    assert threads[0][0] is not loop_thread
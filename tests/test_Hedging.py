@@ -0,0 +1,71 @@
+import time
+import asyncio
+import threading
+import pytest
+from RoBAssessment import Hedging
+
+def hedger(**kwargs):
+    kwargs = {"enabled": True, "min_samples": 3, "budget": 1.0, **kwargs}
+    return Hedging.Hedger(**kwargs)
+
+def warm(h, key="m", seconds=0.01):
+    for _ in range(h.min_samples):
+        h._record(key, seconds)
+
+def test_percentile():
+    assert Hedging.percentile([], 95) is None
+    assert Hedging.percentile(list(range(1, 101)), 95) == 95
+    assert Hedging.percentile([3, 1, 2], 50) == 2
+
+def test_disabled_calls_the_plain_function():
+    h = Hedging.Hedger(enabled=False)
+    assert h.call("m", lambda: "plain", lambda: None) == "plain"
+    assert h.calls == 0
+
+def test_calls_without_enough_latencies_run_on_the_calling_thread():
+    h = hedger()
+    threads = []
+    for _ in range(3):
+        h.call("m", lambda: threads.append(threading.current_thread()), None)
+    assert threads == [threading.current_thread()] * 3
+    assert h.loop is None  # no call went through the hedge loop.
+    assert h.threshold("m") is not None  # their latencies were recorded.
+
+def test_calls_without_hedge_budget_run_on_the_calling_thread():
+    h = hedger(budget=0.0)
+    warm(h)
+    assert h.call("m", threading.current_thread, None) is threading.current_thread()
+    assert h.loop is None
+
+def test_slow_call_is_hedged_and_the_primary_cancelled():
+    h = hedger()
+    warm(h, seconds=0.02)
+    started = []
+    cancelled = []
+
+    async def attempt():
+        started.append(time.monotonic())
+        try:
+            await asyncio.sleep(10 if len(started) == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return len(started)
+
+    begin = time.monotonic()
+    assert h.call("m", None, attempt) == 2
+    assert time.monotonic() - begin < 2
+    time.sleep(0.05)
+    assert cancelled == [True]
+    assert (h.hedged, h.hedge_wins, h.primaries_cancelled) == (1, 1, 1)
+
+def test_errors_of_both_attempts_are_raised():
+    h = hedger()
+    warm(h, seconds=0.01)
+
+    async def attempt():
+        await asyncio.sleep(0.05)
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        h.call("m", None, attempt)
@@ -0,0 +1,112 @@
+import time
+import types
+import pytest
+from RoBAssessment import Assessment as assess
+from RoBAssessment import PerCriteria
+
+ITEMS = [("1.1", {"title": "A", "explanation": "a"}), ("1.2", {"title": "B", "explanation": "b"}),
+         ("1.3", {"title": "C", "explanation": "c"})]
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(assess, "sleep_time", 0)
+    monkeypatch.setattr(assess, "streaming_mode", True)
+
+def parsed(result):
+    output = PerCriteria.AssessmentResultDecisionFirst(result=result, explanation="why")
+    return types.SimpleNamespace(output_parsed=output, output_text="", usage=types.SimpleNamespace(total_tokens=10))
+
+def test_next_sub_criteria_starts_after_the_decision(monkeypatch):
+    events = []
+
+    def call_sub_criteria(prompt, document, file_id, previous_response_id, on_decision):
+        assess.count_request({"input": prompt})
+        events.append(("start", prompt))
+        on_decision("yes", 0.0)
+        time.sleep(0.1)  # explanation still streaming.
+        events.append(("end", prompt))
+        response = parsed("yes")
+        return response, response
+
+    monkeypatch.setattr(PerCriteria, "call_sub_criteria", call_sub_criteria)
+    assess.reset_request_stats()
+    results = PerCriteria.assess_decision_first(ITEMS, "a.md", "text", None, {"id": None})
+
+    assert [r[0].output_parsed.result for r in results] == ["yes"] * 3
+    # Every sub criteria started before the first explanation was complete.
+    assert [e[0] for e in events[:3]] == ["start"] * 3
+    assert assess.get_request_count() == 3  # worker requests are added to the paper.
+
+def test_failed_sub_criteria_do_not_block_the_next(monkeypatch):
+    def call_sub_criteria(prompt, document, file_id, previous_response_id, on_decision):
+        if prompt == "b":
+            raise ValueError("stream failed")
+        response = parsed("no")
+        return response, response
+
+    monkeypatch.setattr(PerCriteria, "call_sub_criteria", call_sub_criteria)
+    results = PerCriteria.assess_decision_first(ITEMS, "a.md", "text", None, {"id": None})
+    assert isinstance(results[1], ValueError)
+    assert results[2][0].output_parsed.result == "no"
+
+### Conversation Mode ###
+
+@pytest.fixture
+def conversation(monkeypatch):
+    monkeypatch.setattr(assess, "streaming_mode", False)
+    monkeypatch.setattr(assess, "robust_mode", False)
+    monkeypatch.setattr(assess, "conversation_mode", True)
+    monkeypatch.setattr(assess, "nested_subs", {"1": dict(ITEMS)})
+    monkeypatch.setattr(PerCriteria.Progress, "current", PerCriteria.Progress.RunProgress("test", 4))
+    deleted = []
+    monkeypatch.setattr(assess, "delete_stored_response", deleted.append)
+
+    def start_conversation(document, file_id):
+        assess.count_request({"input": document})
+        return types.SimpleNamespace(id="resp-paper", usage=types.SimpleNamespace(total_tokens=100))
+
+    def call_sub_criteria(prompt, document, file_id, previous_response_id, on_decision):
+        assert previous_response_id == "resp-paper"
+        assess.count_request({"input": prompt})
+        response = parsed("yes")
+        return response, response
+
+    monkeypatch.setattr(PerCriteria, "call_openai_response_api_start_conversation", start_conversation)
+    monkeypatch.setattr(PerCriteria, "call_sub_criteria", call_sub_criteria)
+    return deleted
+
+def test_conversation_start_is_counted_and_its_response_deleted(conversation):
+    note_entry, raw_note_entry, row, tokens, bytes_sent = PerCriteria.assess_paper(0, "a.md", 1, document="text")
+    progress = PerCriteria.Progress.current.snapshot()
+    assert (progress["completed"], progress["tokens"]) == (4, 130)  # start call + 3 sub criteria.
+    assert tokens == 130
+    assert assess.get_request_count() == 4
+    assert conversation == ["resp-paper"]
+
+def test_stored_response_is_kept_when_configured(conversation, monkeypatch):
+    monkeypatch.setattr(assess, "keep_conversations", True)
+    PerCriteria.assess_paper(0, "a.md", 1, document="text")
+    assert conversation == []
+
+def test_planned_requests_include_the_conversation_start(monkeypatch):
+    monkeypatch.setattr(assess, "streaming_mode", False)
+    monkeypatch.setattr(assess, "robust_mode", True)
+    monkeypatch.setattr(assess, "sub_criteria_count", 3)
+    monkeypatch.setattr(assess, "conversation_mode", False)
+    assert PerCriteria.planned_requests(2) == 2 * 3 * 2
+    monkeypatch.setattr(assess, "conversation_mode", True)
+    assert PerCriteria.planned_requests(2) == 2 * (3 * 2 + 1)
+
+def test_delete_stored_response_on_its_endpoint(monkeypatch):
+    deleted = []
+    a = assess.Dispatcher.Endpoint("a", types.SimpleNamespace(responses=None), None)
+    b = assess.Dispatcher.Endpoint(
+        "b", types.SimpleNamespace(responses=types.SimpleNamespace(delete=deleted.append)), None)
+    dispatcher = assess.Dispatcher.Dispatcher([a, b])
+    dispatcher.pin_response("resp-paper", b)
+    monkeypatch.setattr(assess, "dispatcher", dispatcher)
+    monkeypatch.setitem(assess.context_tokens, "resp-paper", 500)
+    assess.delete_stored_response("resp-paper")
+    assert deleted == ["resp-paper"]
+    assert dispatcher.pinned_endpoint({"previous_response_id": "resp-paper"}) is None
+    assert "resp-paper" not in assess.context_tokens
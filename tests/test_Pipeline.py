@@ -0,0 +1,61 @@
+import time
+import _thread
+import threading
+import pytest
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Pipeline
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(assess, "assessment_workers", 3)
+    monkeypatch.setattr(assess, "prefetch_depth", 2)
+
+def test_results_keep_the_input_order():
+    def assess_paper(i, file_name, value):
+        time.sleep(0.01 * (5 - i))  # later papers finish first.
+        return value
+
+    results = Pipeline.run([f"{n}.md" for n in range(5)], lambda f: {"value": f.upper()}, assess_paper)
+    assert results == [f"{n}.MD" for n in range(5)]
+
+def test_load_and_assessment_errors_are_returned():
+    def load(file_name):
+        if file_name == "bad.md":
+            raise OSError("unreadable")
+        return {}
+
+    def assess_paper(i, file_name):
+        if file_name == "fails.md":
+            raise ValueError("failed")
+        return file_name
+
+    results = Pipeline.run(["a.md", "bad.md", "fails.md"], load, assess_paper)
+    assert results[0] == "a.md"
+    assert isinstance(results[1], OSError)
+    assert isinstance(results[2], ValueError)
+
+def test_loader_stays_at_most_prefetch_depth_ahead(monkeypatch):
+    monkeypatch.setattr(assess, "assessment_workers", 1)
+    loaded, ahead = [], []
+
+    def assess_paper(i, file_name):
+        ahead.append(len(loaded) - i - 1)
+        time.sleep(0.02)
+
+    Pipeline.run([f"{n}.md" for n in range(8)], lambda f: loaded.append(f) or {}, assess_paper)
+    assert max(ahead) <= assess.prefetch_depth + 1  # queued papers + the one waiting to be queued.
+
+def test_interrupt_stops_the_loader_and_the_workers():
+    before = set(threading.enumerate())
+
+    def assess_paper(i, file_name):
+        if i == 0:
+            _thread.interrupt_main()
+        time.sleep(0.2)
+
+    with pytest.raises(KeyboardInterrupt):
+        Pipeline.run([f"{n}.md" for n in range(50)], lambda f: {}, assess_paper)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and set(threading.enumerate()) - before:
+        time.sleep(0.05)
+    assert not set(threading.enumerate()) - before
@@ -0,0 +1,59 @@
+from RoBAssessment import Preprocess
+
+SECTIONS = ["References", "Acknowledgements"]
+
+def test_strip_sections_up_to_the_next_heading_of_the_same_level():
+    text = "\n".join([
+        "# Paper", "## Methods", "Randomised.",
+        "## 5. References", "[1] A.", "### Books", "[2] B.",
+        "## Appendix", "Protocol.",
+    ])
+    result = Preprocess.strip_sections(text, SECTIONS)
+    assert "[1] A." not in result and "[2] B." not in result and "### Books" not in result
+    assert "## Methods\nRandomised." in result
+    assert "## Appendix\nProtocol." in result
+
+def test_bold_and_plain_lines_are_not_headings():
+    text = "\n".join([
+        "## Results", "**References**", "Blinded outcome.",
+        "## Acknowledgements", "Thanks.", "**Funding**", "Grant 1.", "## Discussion", "Text.",
+    ])
+    result = Preprocess.strip_sections(text, SECTIONS)
+    assert "**References**\nBlinded outcome." in result  # a bold line neither starts ...
+    assert "Grant 1." not in result  # ... nor ends a section.
+    assert "## Discussion\nText." in result
+
+def test_repeated_lines_are_removed():
+    lines = []
+    for page in range(5):
+        lines += ["Journal of Tests 2024", f"Page text {page}."] + [f"line {page}-{i}" for i in range(10)]
+    result = Preprocess.remove_repeated_lines("\n".join(lines), min_repeats=4)
+    assert "Journal of Tests 2024" not in result
+    assert "Page text 3." in result
+
+def test_repeated_markup_and_fenced_lines_are_kept():
+    block = ["| a | b |", "- item", "# Heading", "$$", "x = 1", "$$", "```", "same", "```"]
+    lines = []
+    for page in range(5):
+        lines += block + [f"filler {page}-{i}" for i in range(10)]
+    result = Preprocess.remove_repeated_lines("\n".join(lines), min_repeats=4)
+    assert result.count("| a | b |") == 5
+    assert result.count("- item") == 5
+    assert result.count("# Heading") == 5
+    assert result.count("x = 1") == 5
+    assert result.count("same") == 5
+
+def test_close_repeats_are_kept():
+    text = "\n".join(["Yes", "No"] * 5)  # repeated, but not spread over pages.
+    assert Preprocess.remove_repeated_lines(text, min_repeats=4) == text
+
+def test_collapse_tables():
+    table = ["| h |", "|---|"] + [f"| {i} |" for i in range(10)]
+    result = Preprocess.collapse_tables("\n".join(["Before."] + table + ["After."]), max_rows=3)
+    assert "| 2 |" in result and "| 3 |" not in result
+    assert "[Table truncated: 7 more rows omitted.]" in result
+    assert result.endswith("After.")
+
+def test_remove_images_and_normalize_whitespace():
+    text = "A ![fig](a.png) <img src='b'>\r\n\r\n\r\n\r\nB  \t c  \n"
+    assert Preprocess.normalize_whitespace(Preprocess.remove_images(text)) == "A\n\nB c\n"
@@ -0,0 +1,48 @@
+import io
+import logging
+import pytest
+from RoBAssessment import Assessment as assess
+from RoBAssessment import Progress
+
+def test_counts_requests_of_each_item():
+    run = Progress.RunProgress("test", 6)
+    started = run.request_started()
+    run.request_finished(started, 100, requests=2)
+    started = run.request_started()
+    run.request_failed(started, requests=2)
+    s = run.snapshot()
+    assert (s["completed"], s["failed"], s["in_flight"], s["tokens"]) == (2, 2, 0, 100)
+    assert s["eta"] is not None
+
+def test_eta_never_negative():
+    run = Progress.RunProgress("test", 1)
+    run.request_finished(run.request_started(), 10, requests=3)
+    assert run.snapshot()["eta"] == 0
+
+@pytest.mark.parametrize("robust, streaming, expected", [(True, False, 2), (True, True, 1), (False, False, 1)])
+def test_requests_per_item_includes_parser_calls(monkeypatch, robust, streaming, expected):
+    monkeypatch.setattr(assess, "robust_mode", robust)
+    assert Progress.requests_per_item(streaming) == expected
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+def test_log_records_clear_the_status_line(monkeypatch):
+    terminal = Terminal()
+    monkeypatch.setattr(Progress.sys, "stdout", terminal)
+    monkeypatch.setattr(Progress, "current", Progress.RunProgress("test", 2))
+    monkeypatch.setattr(Progress, "_thread", object())  # display running.
+    handler = assess.ConsoleHandler(terminal)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    Progress.redraw()
+    handler.emit(logging.makeLogRecord({"msg": "record"}))
+    Progress.clear_line()
+
+    output = terminal.getvalue()
+    lines = output.split("\n")
+    # The record starts on a cleared line and is never glued to the status line.
+    assert lines[0].endswith("\r\033[Krecord")
+    assert lines[1].startswith("\r\033[K[test]")
+    assert output.endswith("\r\033[K")
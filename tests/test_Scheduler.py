@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from RoBAssessment import Scheduler
+
+def scheduler(tmp_path, **kwargs):
+    return Scheduler.Scheduler(enabled=True, folder=str(tmp_path), **kwargs)
+
+def test_async_submit_runs_the_admission_off_the_event_loop(tmp_path):
+    s = scheduler(tmp_path)
+    s.start_job("test", 1)
+    threads = []
+    admission_pass = s._admission_pass
+
+    def recorded_pass():
+        threads.append(threading.current_thread())
+        admission_pass()
+
+    s._admission_pass = recorded_pass
+
+    async def run():
+        ticket = await s.async_submit({"input": "text", "max_output_tokens": 10})
+        return ticket, threading.current_thread()
+
+    ticket, loop_thread = asyncio.run(run())
+    assert ticket in s.state.read()["in_flight"]
+    assert threads and loop_thread not in threads
+    s.complete(ticket, 5)
+    s.end_job()
+
+### Admission ###
+
+def ticket(id, tokens=100, priority=Scheduler.BATCH, finish=0.0, enqueued=0.0):
+    return {"id": id, "job": "job", "priority": priority, "start": 0.0, "finish": finish, "tokens": tokens,
+            "enqueued": enqueued}
+
+def admit(s, queue, usage=(), in_flight=()):
+    state = Scheduler.empty_state()
+    state["queue"] = list(queue)
+    state["usage"] = [[0.0, tokens, "job"] for tokens in usage]
+    state["in_flight"] = {t["id"]: t for t in in_flight}
+    s._admit(state, 1.0)
+    return [t for t in state["in_flight"] if t not in {t["id"] for t in in_flight}], state
+
+def test_admission_order_is_priority_then_finish(tmp_path):
+    s = scheduler(tmp_path, rpm=2)
+    admitted, state = admit(s, [ticket("late", finish=3.0), ticket("batch", finish=1.0),
+                                ticket("interactive", priority=Scheduler.INTERACTIVE, finish=9.0)])
+    assert admitted == ["interactive", "batch"]
+    assert [t["id"] for t in state["queue"]] == ["late"]
+
+def test_token_budget_counts_usage_and_reservations(tmp_path):
+    s = scheduler(tmp_path, tpm=1000)
+    admitted, state = admit(s, [ticket("a", tokens=300, finish=1.0), ticket("b", tokens=200, finish=2.0),
+                                ticket("c", tokens=10, finish=3.0)],
+                            usage=[400], in_flight=[ticket("running", tokens=200)])
+    assert admitted == ["a"]  # 400 + 200 + 300 = 900, b doesn't fit and c doesn't overtake it.
+
+def test_oversized_request_is_admitted_alone(tmp_path):
+    s = scheduler(tmp_path, tpm=1000)
+    assert admit(s, [ticket("big", tokens=5000)])[0] == ["big"]
+    assert admit(s, [ticket("big", tokens=5000)], usage=[10])[0] == []
+
+def test_no_pacing_by_default(tmp_path):
+    s = scheduler(tmp_path, tpm=1000)
+    assert s.pace_window == 0
+    admitted, state = admit(s, [ticket(str(i), tokens=100, finish=i) for i in range(10)])
+    assert len(admitted) == 10
+    assert state["admissions"] == []
+
+def test_pacing_spreads_the_budget(tmp_path):
+    s = scheduler(tmp_path, tpm=1000, pace_window=6)
+    admitted, state = admit(s, [ticket(str(i), tokens=50, finish=i) for i in range(10)])
+    assert admitted == ["0", "1"]  # 6 / 60 of the budget per window.
+
+### Tickets ###
+
+def test_cancelled_admitted_ticket_is_released_without_charge(tmp_path):
+    s = scheduler(tmp_path, tpm=1000)
+    s.start_job("test", 1)
+    ticket_id = s.submit({"input": "text", "max_output_tokens": 600})
+    state = s.state.read()
+    assert ticket_id in state["in_flight"]
+    s.withdraw(ticket_id)
+    state = s.state.read()
+    assert state["in_flight"] == {} and state["usage"] == []
+    assert state["jobs"][s.job_id]["requests"] == 0
+    s.end_job()
+
+def test_cancelled_async_submit_frees_the_budget(tmp_path):
+    s = scheduler(tmp_path, tpm=1000, poll_interval=0.01)
+    s.start_job("test", 1)
+    first = s.submit({"input": "text", "max_output_tokens": 600})
+
+    async def run():
+        task = asyncio.ensure_future(s.async_submit({"input": "text", "max_output_tokens": 600}))
+        await asyncio.sleep(0.1)  # queued behind the first ticket.
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    state = s.state.read()
+    assert state["queue"] == [] and list(state["in_flight"]) == [first]
+    s.complete(first, 500)
+    assert [u[1] for u in s.state.read()["usage"]] == [500]
+    s.end_job()
+
+def test_configured_folder(tmp_path):
+    config = tmp_path / "config.yaml"
+    config.write_text('scheduler_folder: "shared/scheduler"\n')
+    assert Scheduler.configured_folder(str(config)) == "shared/scheduler"
+    assert Scheduler.configured_folder(str(tmp_path / "missing.yaml")) == "cache/scheduler"
@@ -0,0 +1,74 @@
+import time
+import threading
+import http.server
+import httpx
+import pytest
+from RoBAssessment import Transport
+
+PROFILE = {"connect": 5, "read": 30, "write": 5, "pool": 5}
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+@pytest.fixture
+def client():
+    client = Transport.build_http_client(4, 30, False, PROFILE)
+    yield client
+    client.close()
+
+def test_timeout_profile():
+    timeout = Transport.build_timeout(PROFILE)
+    assert (timeout.connect, timeout.read, timeout.write, timeout.pool) == (5, 30, 5, 5)
+
+def test_metrics_count_reused_connections(server, client, monkeypatch):
+    monkeypatch.setattr(Transport, "metrics", Transport.TransportMetrics())
+    for _ in range(3):
+        assert client.get(server).text == "ok"
+    assert Transport.metrics.requests == 3
+    assert Transport.metrics.new_connections == 1
+
+def test_deadline_returns_the_result(server, client):
+    deadline = Transport.DeadlineExecutor(2)
+    assert deadline.call(5, lambda: client.get(server).text) == "ok"
+    assert deadline.call(None, lambda: "no deadline") == "no deadline"
+
+def test_deadline_closes_the_request(server, client, monkeypatch):
+    monkeypatch.setattr(SlowHandler, "delay", 10.0)
+    outcome = {}
+
+    def call():
+        started = time.monotonic()
+        try:
+            client.get(server)
+        except httpx.HTTPError as e:
+            outcome["error"] = e
+        outcome["seconds"] = time.monotonic() - started
+
+    deadline = Transport.DeadlineExecutor(2)
+    with pytest.raises(TimeoutError):
+        deadline.call(0.5, call)
+    deadline.executor.shutdown(wait=True)
+    # The request stopped at the deadline instead of waiting for the response.
+    assert outcome["seconds"] < 5
+    assert isinstance(outcome["error"], httpx.HTTPError)
+    monkeypatch.setattr(SlowHandler, "delay", 0.0)
+    assert client.get(server).text == "ok"  # the pool still works.